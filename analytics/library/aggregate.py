@@ -0,0 +1,209 @@
+import btrdb
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import points_to_columns
+
+
+STAT_AGG = ['count', 'mean', 'stddev', 'min', 'max', 'time']
+
+
+def combine_stats(counts, means, stddevs, mins, maxs):
+    """
+    Combines the statistics of disjoint windows (e.g. StatPoints) into the statistics of their union.
+    The mean is weighted by the number of points of each window, and the (population) variances are merged
+    with the parallel algorithm, sum(n * (stddev**2 + (mean - global_mean)**2)) / sum(n).
+
+    Parameters
+    ----------
+    counts : numpy.array
+        Number of points in each window.
+    means : numpy.array
+        Mean of each window.
+    stddevs : numpy.array
+        Standard deviation of each window.
+    mins : numpy.array
+        Minimum of each window.
+    maxs : numpy.array
+        Maximum of each window.
+
+    Returns
+    ----------
+    stats : dict
+        'count', 'mean', 'stddev', 'min' and 'max' of all the points, NaN if there are none.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum()
+    if total == 0:
+        return {'count': 0, 'mean': np.nan, 'stddev': np.nan, 'min': np.nan, 'max': np.nan}
+    means = np.asarray(means, dtype=np.float64)
+    mean = np.dot(counts, means) / total
+    var = np.dot(counts, np.square(stddevs) + np.square(means - mean)) / total
+    return {'count': int(total), 'mean': mean, 'stddev': np.sqrt(var),
+            'min': np.min(mins), 'max': np.max(maxs)}
+
+
+def pyramid_windows(start, end, max_pw=62, min_pw=30):
+    """
+    Decomposes [start, end) into a few queries whose stat points cover it exactly, so that the number of queries
+    does not grow with the length of the range: one run of aligned windows of the coarsest pointwidth that fits,
+    one exact window on each side of it down to the finest pointwidth, and raw values for what is left.
+
+    Parameters
+    ----------
+    start : int
+        Start time in nanoseconds.
+    end : int
+        End time in nanoseconds.
+    max_pw : int, default=62
+        Coarsest pointwidth used.
+    min_pw : int, default=30
+        Finest pointwidth used. Parts of the edges not aligned on this pointwidth are returned as raw ranges.
+
+    Returns
+    ----------
+    runs : list of (int, int, int)
+        (pointwidth, start, end) of the run of consecutive aligned windows, fetched with a single aligned_windows() query.
+    edges : list of (int, int)
+        (start, end) of the ranges aligned on min_pw around the run, each fetched as a single window
+        with windows(start, end, end - start, depth=min_pw), which is exact since its boundaries are aligned.
+    raw : list of (int, int)
+        (start, end) of the ranges to query with values().
+    """
+    start, end = int(start), int(end)
+    if start >= end:
+        return [], [], []
+    width = 1 << min_pw
+    # the part of the range aligned on the finest pointwidth
+    first, last = -(-start // width) * width, end - end % width
+    if first >= last:
+        return [], [], [(start, end)]
+    raw = [r for r in ((start, first), (last, end)) if r[0] < r[1]]
+
+    # the coarsest pointwidth with at least one whole window in the aligned part
+    p = max_pw
+    while -(-first // (1 << p)) * (1 << p) + (1 << p) > last:
+        p -= 1
+    run_start, run_end = -(-first // (1 << p)) * (1 << p), last - last % (1 << p)
+    edges = [e for e in ((first, run_start), (run_end, last)) if e[0] < e[1]]
+    return [(p, run_start, run_end)], edges, raw
+
+
+def _aggregate_columns(stream, kind, wstart, wend, pw, version):
+    """
+    Helper function that queries one run of aligned windows, one edge window or one raw range
+    and returns its statistics columns.
+    """
+    if kind == 'windows':
+        # a single window, pw is the depth at which its aligned boundaries are exact
+        _, values = points_to_columns(stream.windows(wstart, wend, wend - wstart, depth=pw, version=version), STAT_AGG)
+        return tuple(values[:, i] for i in range(5))
+    if kind == 'values':
+        _, values = points_to_columns(stream.values(wstart, wend, version), ['value', 'time'])
+        values = values[:, 0]
+        return np.ones(len(values)), values, np.zeros(len(values)), values, values
+    _, values = points_to_columns(stream.aligned_windows(wstart, wend, pw, version), STAT_AGG)
+    return tuple(values[:, i] for i in range(5))
+
+
+def _stream_range(stream, start, end, version):
+    """
+    Helper function that returns the range of a stream, from its earliest and latest points where start or end
+    is None, or (0, 0) if the stream has no data.
+    """
+    if start is None:
+        earliest = stream.earliest(version=version)
+        if earliest is None:
+            return 0, 0
+        start = earliest[0].time
+    if end is None:
+        latest = stream.latest(version=version)
+        if latest is None:
+            return 0, 0
+        end = latest[0].time + 1
+    return start, end
+
+
+def aggregate_streams(streams, start=None, end=None, version=0, max_pw=62, min_pw=30, max_workers=8):
+    """
+    Computes the count, count weighted mean, standard deviation, min and max of many streams over any time range
+    from at most five queries per stream (see pyramid_windows()). All the queries of all the streams run concurrently.
+
+    Parameters
+    ----------
+    streams : btrdb.Stream, [btrdb.Stream], or btrdb.Stream.Streamset
+        Streams to aggregate.
+    start : int or float, default=None
+        Start time in nanoseconds. Defaults to the earliest point of each stream.
+    end : int or float, default=None
+        End time in nanoseconds (exclusive). Defaults to just after the latest point of each stream.
+    version : int, default=0
+        Stream version.
+    max_pw : int, default=62
+        Coarsest pointwidth used.
+    min_pw : int, default=30
+        Finest pointwidth used. Unaligned edges finer than this are read as raw values.
+    max_workers : int, default=8
+        Maximum number of queries running at the same time.
+
+    Returns
+    ----------
+    df : pandas.DataFrame
+        One row per stream indexed by uuid, with columns 'collection', 'name', 'count', 'mean', 'stddev', 'min', 'max'.
+
+    Examples
+    ----------
+    >>> stats = aggregate_streams(db.streams_in_collection('sunshine', tags={'unit': 'volts'}))
+    >>> vnoms = stats['mean']
+    """
+    if isinstance(streams, btrdb.stream.Stream):
+        streams = [streams]
+    streams = list(streams)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if start is None or end is None:
+            ranges = list(executor.map(lambda s: _stream_range(s, start, end, version), streams))
+        else:
+            ranges = [(start, end)] * len(streams)
+
+        tasks = []
+        for ith_stream, (stream, (stream_start, stream_end)) in enumerate(zip(streams, ranges)):
+            runs, edges, raw = pyramid_windows(stream_start, stream_end, max_pw=max_pw, min_pw=min_pw)
+            tasks.extend((ith_stream, 'aligned_windows', s, e, p) for p, s, e in runs)
+            tasks.extend((ith_stream, 'windows', s, e, min_pw) for s, e in edges)
+            tasks.extend((ith_stream, 'values', s, e, None) for s, e in raw)
+
+        results = executor.map(lambda t: _aggregate_columns(streams[t[0]], t[1], t[2], t[3], t[4], version), tasks)
+        columns = [[] for _ in streams]
+        for task, result in zip(tasks, results):
+            columns[task[0]].append(result)
+
+    rows = []
+    for stream, stream_columns in zip(streams, columns):
+        if len(stream_columns) == 0:
+            stats = combine_stats([], [], [], [], [])
+        else:
+            stats = combine_stats(*(np.concatenate(c) for c in zip(*stream_columns)))
+        rows.append(dict(uuid=str(stream.uuid), collection=stream.collection, name=stream.name, **stats))
+    return pd.DataFrame(rows, columns=['uuid', 'collection', 'name', 'count', 'mean', 'stddev', 'min', 'max']
+                        ).set_index('uuid')
+
+
+def aggregate_stream(stream, start=None, end=None, version=0, max_pw=62, min_pw=30, max_workers=8):
+    """
+    Computes the count, count weighted mean, standard deviation, min and max of a single stream.
+    See aggregate_streams() for the parameters.
+
+    Returns
+    ----------
+    stats : dict
+        'count', 'mean', 'stddev', 'min' and 'max' of the stream over the range.
+
+    Examples
+    ----------
+    >>> vnom = aggregate_stream(stream)['mean']
+    """
+    df = aggregate_streams([stream], start=start, end=end, version=version,
+                           max_pw=max_pw, min_pw=min_pw, max_workers=max_workers)
+    return df.iloc[0][['count', 'mean', 'stddev', 'min', 'max']].to_dict()
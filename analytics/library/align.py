@@ -0,0 +1,265 @@
+import numpy as np
+from fractions import Fraction
+
+
+ALIGN_MODES = ('exact', 'nearest', 'resample')
+RESAMPLE_METHODS = ('nearest', 'previous', 'linear')
+
+
+def merge_times(times_list):
+    """
+    Merges the sorted timestamps of many streams into their sorted union, without hashing.
+    The arrays are concatenated and merged with a stable sort, which only merges the already sorted runs.
+
+    Parameters
+    ----------
+    times_list : list of numpy.array of int64
+        Sorted timestamps of each stream in nanoseconds.
+
+    Returns
+    ----------
+    times : numpy.array of int64
+        Sorted union of all timestamps, without duplicates.
+    """
+    if len(times_list) == 0:
+        return np.array([], dtype=np.int64)
+    merged = np.sort(np.concatenate(times_list).astype(np.int64, copy=False), kind='stable')
+    if len(merged) == 0:
+        return merged
+    keep = np.empty(len(merged), dtype=bool)
+    keep[0] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return merged[keep]
+
+
+def cluster_times(times_list, tolerance):
+    """
+    Groups the timestamps of many streams into rows, so that timestamps differing only by jitter share a row.
+    A new row starts wherever two successive merged timestamps are more than `tolerance` apart,
+    and each row is labeled with its earliest timestamp.
+
+    Parameters
+    ----------
+    times_list : list of numpy.array of int64
+        Sorted timestamps of each stream in nanoseconds.
+    tolerance : int
+        Largest difference in nanoseconds between timestamps of the same row.
+        Must be smaller than half the sampling period of the streams.
+
+    Returns
+    ----------
+    times : numpy.array of int64
+        Timestamp of each row in nanoseconds.
+    """
+    merged = merge_times(times_list)
+    if len(merged) == 0:
+        return merged
+    starts = np.empty(len(merged), dtype=bool)
+    starts[0] = True
+    np.greater(np.diff(merged), tolerance, out=starts[1:])
+    return merged[starts]
+
+
+def resample_times(start, end, rate, origin=None):
+    """
+    Returns the timestamps of a fixed rate grid covering [start, end).
+
+    Parameters
+    ----------
+    start : int
+        Start time in nanoseconds.
+    end : int
+        End time in nanoseconds (exclusive).
+    rate : int or float
+        Rate of the grid in hertz, e.g. 30 for a 30 Hz grid.
+    origin : int, default=None
+        Time of one point of the grid in nanoseconds, so that the grids of successive chunks line up.
+        Defaults to start.
+
+    Returns
+    ----------
+    times : numpy.array of int64
+        Timestamps of the grid, rounded to the nanosecond.
+    """
+    if rate <= 0:
+        raise ValueError('rate must be positive.')
+    start, end = int(start), int(end)
+    origin = start if origin is None else int(origin)
+    # exact rational period, so that rounding errors do not accumulate over long ranges
+    period = Fraction(10**9) / Fraction(rate)
+    first = -((origin - start) // period)
+    last = -((origin - end) // period)
+    if last <= first:
+        return np.array([], dtype=np.int64)
+    base = origin + round(first * period)
+    offsets = np.arange(last - first) * float(period) + float(first * period - round(first * period))
+    return base + np.round(offsets).astype(np.int64)
+
+
+def resample_tolerance(rate, method='nearest'):
+    """
+    Returns the default tolerance in nanoseconds of mode='resample' in align_arrays(): one period of the grid,
+    or two periods with method='linear' so that a sample on each side of every grid point can be used.
+    """
+    return int(np.ceil((2e9 if method == 'linear' else 1e9) / rate))
+
+
+def _nearest_index(times, targets, tolerance, method):
+    """
+    Helper function that returns, for every target time, the index of the sample of `times` to use,
+    or -1 if there is none within `tolerance`.
+    """
+    after = np.searchsorted(times, targets, side='right')
+    before = after - 1
+    if method == 'previous':
+        index = before
+        distance = targets - times[np.maximum(before, 0)]
+    else:
+        # the closest of the samples before and after each target
+        after = np.minimum(after, len(times) - 1)
+        before = np.maximum(before, 0)
+        d_before = np.abs(targets - times[before])
+        d_after = np.abs(times[after] - targets)
+        use_after = d_after < d_before
+        index = np.where(use_after, after, before)
+        distance = np.where(use_after, d_after, d_before)
+    valid = index >= 0
+    if tolerance is not None:
+        valid &= distance <= tolerance
+    return np.where(valid, index, -1)
+
+
+def _interpolate(times, values, targets, max_gap, out):
+    """
+    Helper function that linearly interpolates the columns of `values` at the target times into `out`,
+    leaving NaN outside the samples and inside gaps longer than `max_gap`.
+    """
+    after = np.searchsorted(times, targets, side='left')
+    inside = (after > 0) & (after < len(times))
+    exact = (after < len(times)) & (times[np.minimum(after, len(times) - 1)] == targets)
+    after = np.minimum(after, len(times) - 1)
+    before = np.maximum(after - 1, 0)
+    if max_gap is not None:
+        inside &= times[after] - times[before] <= max_gap
+    # offsets relative to the previous sample, float64 cannot hold absolute timestamps to the nanosecond
+    span = (times[after] - times[before]).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = ((targets - times[before]) / span)[:, None]
+        result = values[before] * (1 - frac) + values[after] * frac
+    result[exact] = values[after[exact]]
+    rows = inside | exact
+    out[rows] = result[rows]
+
+
+def align_arrays(times_list, values_list, mode='exact', tolerance=None, rate=None, method='nearest',
+                 start=None, end=None, origin=None, how='outer'):
+    """
+    Aligns the columns of many streams on one shared time vector and returns them as a single dense 2-D array.
+    The timestamps are merged in one pass over the sorted arrays, and every stream is written straight into
+    its columns of a preallocated matrix, without building per-stream indexes or joining dataframes.
+
+    Parameters
+    ----------
+    times_list : list of numpy.array of int64
+        Sorted timestamps of each stream in nanoseconds.
+    values_list : list of numpy.array of float64
+        2-D values of each stream with one column per aggregate.
+    mode : str, default='exact'
+        'exact' aligns on the union of all timestamps.
+        'nearest' groups the timestamps closer than `tolerance` into the same row (e.g. the jitter between PMUs).
+        'resample' samples every stream on a fixed rate grid of `rate` hertz.
+    tolerance : int, default=None
+        'nearest' mode: largest difference in nanoseconds between timestamps of the same row (required).
+        'resample' mode: largest distance in nanoseconds between a grid point and the sample used for it,
+        or largest gap interpolated with method='linear'. Defaults to one period of the grid,
+        or two periods with method='linear'.
+    rate : int or float, default=None
+        Rate of the grid in hertz, required by the 'resample' mode.
+    method : str, default='nearest'
+        How the 'resample' mode samples each stream: 'nearest' sample, 'previous' sample or 'linear' interpolation.
+    start : int, default=None
+        Start of the grid in nanoseconds for the 'resample' mode. Defaults to the earliest timestamp.
+    end : int, default=None
+        End of the grid in nanoseconds (exclusive) for the 'resample' mode. Defaults to just after the latest timestamp.
+    origin : int, default=None
+        Time of one point of the grid in nanoseconds, see resample_times(). Defaults to start.
+    how : str, default='outer'
+        'outer' keeps every row, with NaN where a stream has no point. 'inner' only keeps the rows where
+        every stream has a point.
+
+    Returns
+    ----------
+    times : numpy.array of int64
+        Shared timestamps of the rows in nanoseconds.
+    matrix : numpy.array of float64
+        2-D array with the columns of all streams side by side.
+
+    Examples
+    ----------
+    >>> times, matrix = align_arrays(times_list, values_list, mode='nearest', tolerance=ns_delta(milliseconds=2))
+    >>> times, matrix = align_arrays(times_list, values_list, mode='resample', rate=30, method='linear')
+    """
+    if mode not in ALIGN_MODES:
+        raise ValueError(f'mode must be one of {ALIGN_MODES}.')
+    if how not in ('outer', 'inner'):
+        raise ValueError("how must be 'outer' or 'inner'.")
+    n_columns = sum(v.shape[1] for v in values_list)
+    if len(times_list) == 0:
+        return np.array([], dtype=np.int64), np.empty((0, n_columns), dtype=np.float64)
+
+    if mode == 'exact' and all(np.array_equal(times_list[0], t) for t in times_list[1:]):
+        # streams queried with the same aligned windows share their timestamps, which avoids the merge
+        times = np.asarray(times_list[0], dtype=np.int64)
+        matrix = np.hstack(values_list) if len(values_list) > 1 else values_list[0]
+        return times, matrix
+
+    if mode == 'exact':
+        times = merge_times(times_list)
+    elif mode == 'nearest':
+        if tolerance is None:
+            raise ValueError("tolerance must be specified with mode='nearest'.")
+        times = cluster_times(times_list, tolerance)
+    else:
+        if rate is None:
+            raise ValueError("rate must be specified with mode='resample'.")
+        if method not in RESAMPLE_METHODS:
+            raise ValueError(f'method must be one of {RESAMPLE_METHODS}.')
+        if start is None:
+            start = min(t[0] for t in times_list if len(t) > 0)
+        if end is None:
+            end = max(t[-1] for t in times_list if len(t) > 0) + 1
+        times = resample_times(start, end, rate, origin=origin)
+        if tolerance is None:
+            tolerance = resample_tolerance(rate, method)
+
+    matrix = np.full((len(times), n_columns), np.nan)
+    present = np.zeros(len(times), dtype=np.int64) if how == 'inner' else None
+    col = 0
+    for ith_stream, (stream_times, values) in enumerate(zip(times_list, values_list)):
+        width = values.shape[1]
+        if len(stream_times) > 0:
+            target = matrix[:, col:col + width]
+            if mode == 'resample' and method == 'linear':
+                _interpolate(stream_times, values, times, tolerance, target)
+                if present is not None:
+                    present += ~np.isnan(target).all(axis=1)
+            elif mode == 'resample':
+                index = _nearest_index(stream_times, times, tolerance, method)
+                rows = index >= 0
+                target[rows] = values[index[rows]]
+                if present is not None:
+                    present += rows
+            else:
+                # every timestamp of the stream is in the merged times, searchsorted only finds its row
+                rows = np.searchsorted(times, stream_times, side='right') - 1
+                if mode == 'nearest' and np.any(np.diff(rows) == 0):
+                    raise ValueError(f'tolerance is too large: stream {ith_stream} has several points in the same row.')
+                target[rows] = values
+                if present is not None:
+                    present[rows] += 1
+        col += width
+
+    if present is not None:
+        keep = present == len(times_list)
+        times, matrix = times[keep], matrix[keep]
+    return times, matrix
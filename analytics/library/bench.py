@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+from .fake import FakeBTrDB
+from .utils import streams_to_df, get_streamset, window_avg
+from .search import find_threshold_points
+
+
+# name -> function(dataset) running the benchmarked code once and returning the number of points it processed
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Decorator registering a benchmark function under name.
+    The function receives the dataset of make_dataset() and returns the number of points it processed.
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def make_dataset(n_pmus=4, minutes=10, rate=30, pow_seconds=10, pow_rate=50000, n_sags=5, latency=0.002,
+                 bandwidth=None, jitter=0, seed=0):
+    """
+    Builds a FakeBTrDB connection holding synthetic PMU and point-on-wave data to run the benchmarks on.
+    The same arguments always generate the same data.
+
+    Parameters
+    ----------
+    n_pmus : int, default=4
+        Number of PMUs, each with 12 phasor streams (collections 'sunshine/PMU1', 'sunshine/PMU2', ...).
+    minutes : int or float, default=10
+        Duration of the PMU data in minutes.
+    rate : int or float, default=30
+        Reporting rate of the PMUs in hertz.
+    pow_seconds : int or float, default=10
+        Duration of the point-on-wave data in seconds ('POW/signatures/event1', three phases).
+    pow_rate : int or float, default=50000
+        Sample rate of the point-on-wave data in hertz.
+    n_sags : int, default=5
+        Number of voltage sags injected in each PMU, and of faults injected in the waveform.
+    latency : float, default=0.002
+        Simulated round trip of every call in seconds.
+    bandwidth : float, default=None
+        Simulated points transferred per second, unlimited if None.
+    jitter : int, default=0
+        Maximum random offset of the PMU timestamps in nanoseconds.
+    seed : int, default=0
+        Seed of the synthetic data.
+
+    Returns
+    ----------
+    dataset : dict
+        'db' connection, 'start' and 'end' of the PMU data, 'pmus' list of the streams of each PMU,
+        'voltages' list of all the voltage magnitude streams, 'waveforms' point-on-wave streams,
+        'nominal_voltage', 'rate', 'pow_rate' and 'params', the arguments it was generated with.
+    """
+    params = dict(n_pmus=n_pmus, minutes=minutes, rate=rate, pow_seconds=pow_seconds, pow_rate=pow_rate,
+                  n_sags=n_sags, latency=latency, bandwidth=bandwidth, jitter=jitter, seed=seed)
+    db = FakeBTrDB(latency=0, bandwidth=None, seed=seed)
+    start = 1_600_000_000 * 10**9
+    duration = int(minutes * 60e9)
+    rng = np.random.default_rng(seed)
+
+    pmus = []
+    for ith_pmu in range(n_pmus):
+        sag_times = np.sort(rng.integers(start, start + duration, n_sags))
+        sags = [(int(t), int(rng.uniform(0.05e9, 0.5e9)), rng.uniform(0.1, 0.5)) for t in sag_times]
+        pmus.append(db.add_pmu(f'sunshine/PMU{ith_pmu + 1}', start, duration, rate=rate, jitter=jitter, sags=sags))
+
+    pow_duration = int(pow_seconds * 1e9)
+    fault_times = np.sort(rng.integers(start, start + pow_duration, n_sags))
+    faults = [(int(t), int(0.05e9), rng.uniform(0.2, 0.8)) for t in fault_times]
+    waveforms = db.add_point_on_wave('POW/signatures/event1', start, pow_duration, rate=pow_rate, faults=faults)
+
+    # the latency only applies to the benchmarked calls, not to the generation of the data
+    db.latency, db.bandwidth = latency, bandwidth
+    return {'db': db, 'start': start, 'end': start + duration, 'pmus': pmus,
+            'voltages': [s for streams in pmus for s in streams if s.name.startswith('L') and s.name.endswith('MAG')],
+            'waveforms': waveforms, 'nominal_voltage': 7200.0, 'rate': rate, 'pow_rate': pow_rate, 'params': params}
+
+
+@benchmark('streams_to_df raw')
+def bench_streams_to_df_raw(dataset):
+    df = streams_to_df(dataset['voltages'], dataset['start'], dataset['end'], max_workers=8, disable_progress_bar=True)
+    return int(df.count().sum())
+
+
+@benchmark('streams_to_df stat points')
+def bench_streams_to_df_stat(dataset):
+    streams = [s for streams in dataset['pmus'] for s in streams]
+    df = streams_to_df(streams, dataset['start'], dataset['end'], pw=30, max_workers=8, disable_progress_bar=True)
+    return int(df.xs('count', axis=1, level='agg').sum().sum())
+
+
+@benchmark('get_streamset')
+def bench_get_streamset(dataset):
+    streams = get_streamset(dataset['db'], 'sunshine', name=['L1MAG', 'L2MAG', 'L3MAG'],
+                            annotations={'sample_rate': str(dataset['rate'])})
+    return len(streams)
+
+
+@benchmark('sag search')
+def bench_sag_search(dataset):
+    hits = list(find_threshold_points(dataset['voltages'], 0.9 * dataset['nominal_voltage'],
+                                      dataset['start'], dataset['end'], pw=36, raw_pw=30))
+    return len(hits)
+
+
+@benchmark('window_avg')
+def bench_window_avg(dataset):
+    stream = dataset['voltages'][0]
+    # local computation only, the values are read directly from the fake stream
+    values = stream._values
+    for _ in range(10):
+        window_avg(values, 1 / dataset['rate'], num_seconds=60)
+    return 10 * len(values)
+
+
+def _load_point_on_wave_utils():
+    """
+    Helper function that imports point-on-wave/utils.py, which is not part of a package.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'point-on-wave', 'utils.py')
+    spec = importlib.util.spec_from_file_location('point_on_wave_utils', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@benchmark('bulk_insert')
+def bench_bulk_insert(dataset):
+    pow_utils = _load_point_on_wave_utils()
+    # a throwaway connection with the same latency, so that the shared dataset is the same for every run
+    db = FakeBTrDB(latency=dataset['db'].latency, bandwidth=dataset['db'].bandwidth)
+    data = {}
+    for source in dataset['waveforms']:
+        stream = db.create(db._uuid(), 'bench/ingestion', tags=dict(name=source.name, unit=source.unit))
+        data[stream] = (source._times, source._values)
+    stats = pow_utils.bulk_insert(data, batch_size=50000, max_workers=4, verbose=False)
+    return stats['points']
+
+
+def run_benchmarks(names=None, repeat=5, dataset=None, history=None, label=None, verbose=True, **dataset_kwargs):
+    """
+    Runs the registered benchmarks on synthetic data and reports the best and median time of each one.
+
+    Parameters
+    ----------
+    names : list of str, default=None
+        Benchmarks to run, see BENCHMARKS. Defaults to all of them.
+    repeat : int, default=5
+        Number of timed runs of each benchmark, after one warm up run.
+    dataset : dict, default=None
+        Dataset returned by make_dataset(). Generated with dataset_kwargs if None.
+    history : str, default=None
+        Path of a JSON lines file the results are appended to, to track them across runs (see compare_runs()).
+    label : str, default=None
+        Label of the run in the history, e.g. a branch name or a commit hash.
+    verbose : bool, default=True
+        Print each result as it completes.
+    dataset_kwargs :
+        Parameters of make_dataset().
+
+    Returns
+    ----------
+    results : pandas.DataFrame
+        One row per benchmark, with columns 'best', 'median' (seconds), 'points' and 'points_per_sec'.
+
+    Examples
+    ----------
+    >>> results = run_benchmarks(history='bench.jsonl', label='master', n_pmus=8, latency=0.005)
+    >>> run_benchmarks(['streams_to_df raw', 'sag search'], repeat=3)
+    """
+    names = list(BENCHMARKS) if names is None else names
+    unknown = set(names).difference(BENCHMARKS)
+    if len(unknown) > 0:
+        raise ValueError(f'unknown benchmarks {unknown}, available benchmarks are {list(BENCHMARKS)}')
+    if dataset is None:
+        dataset = make_dataset(**dataset_kwargs)
+
+    rows = []
+    for name in names:
+        func = BENCHMARKS[name]
+        points = func(dataset)
+        times = []
+        for _ in range(repeat):
+            go = time.perf_counter()
+            func(dataset)
+            times.append(time.perf_counter() - go)
+        best = min(times)
+        rows.append({'benchmark': name, 'best': best, 'median': float(np.median(times)), 'points': points,
+                     'points_per_sec': points / best if best > 0 else np.nan})
+        if verbose:
+            print(f"{name:<30} best {best * 1e3:10.2f} ms   median {rows[-1]['median'] * 1e3:10.2f} ms   "
+                  f"{points} points")
+    results = pd.DataFrame(rows).set_index('benchmark')
+
+    if history is not None:
+        record = {'time': time.time(), 'label': label, 'repeat': repeat,
+                  'dataset': dataset.get('params', dataset_kwargs),
+                  'results': results.reset_index().to_dict(orient='records')}
+        with open(history, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    return results
+
+
+def load_history(history):
+    """
+    Reads the results recorded by run_benchmarks() into a dataframe with one row per run and benchmark,
+    with columns 'run', 'time', 'label', 'benchmark', 'best', 'median', 'points' and 'points_per_sec'.
+    """
+    rows = []
+    with open(history) as f:
+        for run, line in enumerate(f):
+            record = json.loads(line)
+            for result in record['results']:
+                rows.append({'run': run, 'time': pd.to_datetime(record['time'], unit='s'),
+                             'label': record.get('label'), **result})
+    return pd.DataFrame(rows)
+
+
+def compare_runs(history, baseline=-2, current=-1, threshold=1.1):
+    """
+    Compares the best times of two runs recorded in a history file, to catch performance regressions.
+
+    Parameters
+    ----------
+    history : str
+        Path of the history file written by run_benchmarks().
+    baseline : int or str, default=-2
+        Index of the baseline run (negative indices count from the last run), or its label.
+    current : int or str, default=-1
+        Index or label of the run compared to the baseline.
+    threshold : float, default=1.1
+        Ratio of the best times above which a benchmark is flagged as a regression.
+
+    Returns
+    ----------
+    comparison : pandas.DataFrame
+        One row per benchmark run in both, with the 'baseline' and 'current' best times, their 'ratio'
+        and a 'regression' flag.
+
+    Examples
+    ----------
+    >>> compare_runs('bench.jsonl', baseline='master', current='my-branch')
+    """
+    df = load_history(history)
+
+    def select(run):
+        if isinstance(run, str):
+            runs = df.loc[df['label'] == run, 'run']
+            if len(runs) == 0:
+                raise ValueError(f'no run labeled {run} in {history}')
+            run = runs.max()
+        else:
+            run = sorted(df['run'].unique())[run]
+        return df[df['run'] == run].set_index('benchmark')['best']
+
+    comparison = pd.concat([select(baseline).rename('baseline'), select(current).rename('current')],
+                           axis=1, join='inner')
+    comparison['ratio'] = comparison['current'] / comparison['baseline']
+    comparison['regression'] = comparison['ratio'] > threshold
+    return comparison
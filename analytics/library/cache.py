@@ -0,0 +1,220 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from .utils import points_to_columns
+
+
+RAW_COLUMNS = ['time', 'value']
+STAT_COLUMNS = ['time', 'min', 'mean', 'max', 'count', 'stddev']
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ni4ai', 'queries')
+
+
+class QueryCache(object):
+    """
+    Persistent on-disk cache of values(), aligned_windows() and windows() results.
+
+    Every query result is stored as one memory-mappable .npy file per column, keyed by
+    (stream uuid, stream version, query kind, start, end, pointwidth/width, depth).
+    Because the stream version is part of the key, data inserted or deleted after a result was cached
+    is never served; entries of older versions of a stream are removed as soon as a newer version is stored.
+    The total size on disk is bounded, and the least recently used entries are evicted first.
+
+    Parameters
+    ----------
+    path : str, default=~/.cache/ni4ai/queries
+        Directory used to store the cached results.
+    max_bytes : int, default=2**30
+        Maximum size of the cache on disk in bytes.
+
+    Examples
+    ----------
+    >>> cache = QueryCache(max_bytes=10 * 2**30)
+    >>> data = streams_to_df(streamset, start_time, end_time, pw=26, cache=cache)
+    >>> vnom = get_global_mean_value(stream, cache=cache)
+    """
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # entry path -> (size in bytes, stream version), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._size = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for uuid_dir in os.listdir(self.path):
+            uuid_path = os.path.join(self.path, uuid_dir)
+            if not os.path.isdir(uuid_path):
+                continue
+            for entry in os.listdir(uuid_path):
+                entry_path = os.path.join(uuid_path, entry)
+                if entry.startswith('.') or not os.path.exists(os.path.join(entry_path, 'meta.json')):
+                    # leftovers of an interrupted write
+                    shutil.rmtree(entry_path, ignore_errors=True)
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry_path, f)) for f in os.listdir(entry_path))
+                with open(os.path.join(entry_path, 'meta.json')) as f:
+                    version = json.load(f)['version']
+                entries.append((os.path.getmtime(entry_path), entry_path, size, version))
+        for _, entry_path, size, version in sorted(entries):
+            self._entries[entry_path] = (size, version)
+            self._size += size
+
+    @staticmethod
+    def key(uuid, version, kind, start, end, param=None, depth=None):
+        """
+        Returns the cache key of a query as a hex digest.
+        """
+        key = f"{uuid}|{version}|{kind}|{int(start)}|{int(end)}|{param}|{depth}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _entry_path(self, uuid, key):
+        return os.path.join(self.path, str(uuid), key)
+
+    def get(self, uuid, version, kind, start, end, param=None, depth=None):
+        """
+        Returns the cached columns of a query as a dict of memory-mapped arrays, or None if it is not cached.
+        """
+        entry_path = self._entry_path(uuid, self.key(uuid, version, kind, start, end, param, depth))
+        with self._lock:
+            if entry_path not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_path)
+
+        try:
+            os.utime(entry_path)
+            with open(os.path.join(entry_path, 'meta.json')) as f:
+                meta = json.load(f)
+            # empty arrays cannot be memory-mapped
+            mmap_mode = 'r' if meta['length'] > 0 else None
+            columns = {c: np.load(os.path.join(entry_path, f'{c}.npy'), mmap_mode=mmap_mode) for c in meta['columns']}
+        except OSError:
+            # evicted by a concurrent put() since it was looked up
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return columns
+
+    def put(self, uuid, version, kind, start, end, columns, param=None, depth=None):
+        """
+        Stores the columns of a query result and evicts older versions of the stream and least recently used entries.
+        """
+        key = self.key(uuid, version, kind, start, end, param, depth)
+        entry_path = self._entry_path(uuid, key)
+        uuid_path = os.path.dirname(entry_path)
+        os.makedirs(uuid_path, exist_ok=True)
+
+        # write to a hidden directory first so that readers never see a partial entry
+        tmp_path = os.path.join(uuid_path, f'.{key}.{threading.get_ident()}')
+        os.makedirs(tmp_path, exist_ok=True)
+        for c, array in columns.items():
+            np.save(os.path.join(tmp_path, f'{c}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'uuid': str(uuid), 'version': int(version), 'columns': list(columns),
+                       'length': len(columns['time'])}, f)
+        size = sum(os.path.getsize(os.path.join(tmp_path, f)) for f in os.listdir(tmp_path))
+
+        with self._lock:
+            if entry_path in self._entries:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return
+            os.rename(tmp_path, entry_path)
+            self._entries[entry_path] = (size, int(version))
+            self._size += size
+            self._invalidate(uuid_path, version)
+            self._evict()
+
+    def _invalidate(self, uuid_path, version):
+        stale = [p for p, (_, v) in self._entries.items() if v < version and os.path.dirname(p) == uuid_path]
+        for entry_path in stale:
+            self._remove(entry_path)
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_path):
+        self._size -= self._entries.pop(entry_path)[0]
+        shutil.rmtree(entry_path, ignore_errors=True)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            for entry_path in list(self._entries):
+                self._remove(entry_path)
+
+    @property
+    def size(self):
+        """
+        Size of the cache on disk in bytes.
+        """
+        return self._size
+
+    def fetch(self, stream, start, end, pw=None, width=None, depth=None, version=0):
+        """
+        Returns the columns of a values(), aligned_windows() or windows() query, from the cache if possible.
+
+        Parameters
+        ----------
+        stream : btrdb.Stream
+            Stream object.
+        start : int or float
+            Start time to query data in nanoseconds.
+        end : int or float
+            End time to query data in nanoseconds.
+        pw : int, default=None
+            Pointwidth used to query data using aligned_windows().
+        width : int, default=None
+            Width used to query data using windows().
+        depth : int, default=None
+            Depth used to query data using windows().
+        version : int, default=0
+            Stream version. 0 resolves to the current version of the stream.
+
+        Returns
+        ----------
+        columns : dict of numpy.array
+            'time' and 'value' for raw values, 'time', 'min', 'mean', 'max', 'count' and 'stddev' for stat points.
+        """
+        if version == 0:
+            version = stream.version()
+
+        if pw is not None:
+            kind, param, names = 'aligned_windows', int(pw), STAT_COLUMNS
+        elif width is not None:
+            kind, param, names = 'windows', int(width), STAT_COLUMNS
+        else:
+            kind, param, names = 'values', None, RAW_COLUMNS
+
+        columns = self.get(stream.uuid, version, kind, start, end, param, depth)
+        if columns is not None:
+            return columns
+
+        # pin the query to the resolved version so the stored data always matches its key
+        if pw is not None:
+            data = stream.aligned_windows(start, end, pw, version)
+        elif width is not None:
+            data = stream.windows(start, end, width, depth=depth, version=version)
+        else:
+            data = stream.values(start, end, version)
+
+        times, values = points_to_columns(data, names)
+        columns = {'time': times}
+        for i, c in enumerate(names[1:]):
+            columns[c] = values[:, i]
+        self.put(stream.uuid, version, kind, start, end, columns, param, depth)
+        return columns
@@ -0,0 +1,596 @@
+import json
+
+import numpy as np
+
+from .utils import iter_streams_chunks
+
+
+# samples of a channel processed at once by ChangeDetector
+DETECT_BLOCK = 4096
+
+EVENT_FIELDS = ('time', 'start', 'channel', 'kind', 'value', 'baseline', 'score', 'label')
+
+
+def _empty_events():
+    return {'time': np.array([], dtype=np.int64), 'start': np.array([], dtype=np.int64),
+            'channel': np.array([], dtype=np.int64), 'kind': np.array([], dtype='<U8'),
+            'value': np.array([], dtype=np.float64), 'baseline': np.array([], dtype=np.float64),
+            'score': np.array([], dtype=np.float64), 'label': np.array([], dtype=np.int64)}
+
+
+def cusum(x, s0=0.0):
+    """
+    One sided CUSUM statistic S_n = max(0, S_(n-1) + x_n) of a whole array at once, using the identity
+    S_n = C_n - min(0, min_(j<=n) C_j) with C_n = s0 + x_1 + ... + x_n.
+
+    Parameters
+    ----------
+    x : numpy.array of float64
+        Increments, e.g. standardized deviations minus the allowance k.
+    s0 : float, default=0.0
+        Statistic before the first increment.
+
+    Returns
+    ----------
+    s : numpy.array of float64
+        Statistic after each increment.
+    """
+    c = s0 + np.cumsum(x)
+    return c - np.minimum(np.minimum.accumulate(c), 0)
+
+
+class RunningUnwrap(object):
+    """
+    Unwraps phase angles chunk by chunk, carrying the last angle and the accumulated offset of every column
+    to the next chunk, so that the result is the same as unwrapping the whole history at once.
+    Missing values (NaN) stay NaN and are skipped.
+
+    Parameters
+    ----------
+    period : float, default=360
+        Period of the angles, 360 for degrees or 2 * np.pi for radians.
+
+    Examples
+    ----------
+    >>> unwrap = RunningUnwrap(period=360)
+    >>> for times, values, columns in iter_streams_chunks(angle_streams, start, end, chunk_ns=ns_delta(hours=1), as_array=True):
+    ...     unwrapped = unwrap.update(values)
+    """
+    def __init__(self, period=360):
+        self.period = period
+        self.last = None
+
+    def update(self, angles):
+        """
+        Returns the unwrapped angles of a (n_samples, n_columns) chunk.
+        """
+        angles = np.asarray(angles, dtype=np.float64)
+        if angles.ndim == 1:
+            return self.update(angles[:, None])[:, 0]
+        if self.last is None:
+            self.last = np.full((2, angles.shape[1]), np.nan)
+        if len(angles) == 0:
+            return angles.copy()
+        # the first valid angle of a column is its own reference
+        first = angles[np.argmax(~np.isnan(angles), axis=0), np.arange(angles.shape[1])]
+        unseen = np.isnan(self.last[0])
+        self.last[:, unseen] = first[unseen]
+        previous_wrapped, previous_unwrapped = self.last
+
+        # forward fill the missing angles so that each step is taken from the last valid angle
+        data = np.vstack([previous_wrapped, angles])
+        valid = ~np.isnan(data)
+        rows = np.where(valid, np.arange(len(data))[:, None], 0)
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        filled = data[rows, np.arange(data.shape[1])]
+
+        steps = np.diff(filled, axis=0)
+        steps = (steps + self.period / 2) % self.period - self.period / 2
+        steps[np.isnan(steps)] = 0
+        unwrapped = previous_unwrapped + np.cumsum(steps, axis=0)
+
+        last_valid = valid[1:].any(axis=0)
+        self.last = np.vstack([np.where(last_valid, filled[-1], previous_wrapped),
+                               np.where(last_valid, unwrapped[-1], previous_unwrapped)])
+        unwrapped[~valid[1:]] = np.nan
+        return unwrapped
+
+    def state(self):
+        return {'period': self.period, 'last': self.last}
+
+    def load_state(self, state):
+        self.period = float(state['period'])
+        self.last = None if state['last'] is None else np.asarray(state['last'], dtype=np.float64)
+
+
+class OnlineGaussianMixture(object):
+    """
+    One dimensional Gaussian mixture model of every column, updated chunk by chunk with stepwise EM
+    (each chunk moves the sufficient statistics towards those of the chunk with a decreasing step size),
+    so that it follows the whole history in constant memory instead of being refitted on it.
+    Online counterpart of fitting sklearn.mixture.GaussianMixture on each column.
+
+    Parameters
+    ----------
+    n_components : int, default=2
+        Number of components of each mixture.
+    decay : float, default=0.6
+        Step size of chunk t is (t + 2) ** -decay. Smaller values forget the past faster (0.5 < decay <= 1).
+    min_var : float, default=1e-9
+        Floor of the variance of the components.
+
+    Attributes
+    ----------
+    weights_, means_, vars_ : numpy.array of float64
+        (n_columns, n_components) parameters of the mixture of each column.
+    """
+    def __init__(self, n_components=2, decay=0.6, min_var=1e-9):
+        self.n_components = n_components
+        self.decay = decay
+        self.min_var = min_var
+        self.weights_ = None
+        self.means_ = None
+        self.vars_ = None
+        self._stats = None
+        self._steps = None
+
+    def _init(self, n_columns):
+        """
+        Helper function that adds untrained columns up to n_columns.
+        """
+        n_old = 0 if self._steps is None else len(self._steps)
+        shape = (n_columns - n_old, self.n_components)
+        new = {'weights_': np.full(shape, 1 / self.n_components), 'means_': np.zeros(shape),
+               'vars_': np.ones(shape)}
+        for name, value in new.items():
+            old = getattr(self, name)
+            setattr(self, name, value if old is None else np.concatenate([old, value]))
+        stats = np.zeros((3,) + shape)
+        self._stats = stats if self._stats is None else np.concatenate([self._stats, stats], axis=1)
+        self._steps = np.zeros(n_columns) if self._steps is None else np.concatenate([self._steps, np.zeros(shape[0])])
+
+    def _log_resp(self, x, columns=slice(None)):
+        """
+        Helper function that returns the (n_samples, n_columns, n_components) log responsibilities of x,
+        whose columns are the given columns of the model.
+        """
+        x = x[:, :, None]
+        weights, means, variances = self.weights_[columns], self.means_[columns], self.vars_[columns]
+        log_prob = np.log(weights) - 0.5 * np.log(2 * np.pi * variances) - 0.5 * np.square(x - means) / variances
+        return log_prob - np.logaddexp.reduce(log_prob, axis=2, keepdims=True)
+
+    def update(self, x):
+        """
+        Updates the mixture of each column with a (n_samples, n_columns) chunk. NaN values are ignored.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            x = x[:, None]
+        if self._steps is None or x.shape[1] > len(self._steps):
+            self._init(x.shape[1])
+        valid = ~np.isnan(x)
+        n_valid = valid.sum(axis=0)
+
+        # columns seen for the first time start from the quantiles of their first chunk
+        new = (self._steps == 0) & (n_valid >= self.n_components)
+        if new.any():
+            quantiles = (np.arange(self.n_components) + 0.5) / self.n_components
+            with np.errstate(invalid='ignore'):
+                self.means_[new] = np.nanquantile(x[:, new], quantiles, axis=0).T
+                spread = np.nanvar(x[:, new], axis=0) / self.n_components ** 2
+            self.vars_[new] = np.maximum(spread, self.min_var)[:, None]
+            self.weights_[new] = 1 / self.n_components
+
+        ready = (self._steps > 0) | new
+        columns = ready & (n_valid > 0)
+        if not columns.any():
+            return self
+        xs = np.where(valid, x, 0)[:, columns]
+        # responsibilities of the valid samples only
+        resp = np.exp(self._log_resp(xs, columns)) * valid[:, columns, None]
+        n = n_valid[columns][:, None]
+        batch = np.stack([resp.sum(axis=0) / n,
+                          (resp * xs[:, :, None]).sum(axis=0) / n,
+                          (resp * np.square(xs)[:, :, None]).sum(axis=0) / n])
+
+        step = (self._steps[columns] + 2) ** -self.decay
+        step[self._steps[columns] == 0] = 1.0
+        stats = self._stats[:, columns]
+        stats += step[None, :, None] * (batch - stats)
+        self._stats[:, columns] = stats
+        self._steps[columns] += 1
+
+        weights = np.maximum(stats[0], 1e-12)
+        self.weights_[columns] = weights / weights.sum(axis=1, keepdims=True)
+        self.means_[columns] = stats[1] / weights
+        self.vars_[columns] = np.maximum(stats[2] / weights - np.square(self.means_[columns]), self.min_var)
+        return self
+
+    def predict_proba(self, x):
+        """
+        Returns the (n_samples, n_columns, n_components) probability of each component for each sample.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            x = x[:, None]
+        return np.exp(self._log_resp(x))
+
+    def predict(self, x):
+        """
+        Returns the (n_samples, n_columns) most likely component of each sample, -1 for NaN values.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            x = x[:, None]
+        labels = np.argmax(self._log_resp(np.nan_to_num(x)), axis=2)
+        labels[np.isnan(x)] = -1
+        return labels
+
+    def state(self):
+        return {'n_components': self.n_components, 'decay': self.decay, 'min_var': self.min_var,
+                'weights': self.weights_, 'means': self.means_, 'vars': self.vars_, 'stats': self._stats,
+                'steps': self._steps}
+
+    def load_state(self, state):
+        self.n_components = int(state['n_components'])
+        self.decay = float(state['decay'])
+        self.min_var = float(state['min_var'])
+        self.weights_, self.means_, self.vars_ = state['weights'], state['means'], state['vars']
+        self._stats, self._steps = state['stats'], state['steps']
+
+
+class ChangeDetector(object):
+    """
+    Online change detector of many channels (e.g. the voltage magnitudes or phase angles of hundreds of PMUs),
+    fed with chunks of data in time order and emitting change events as they arrive, in constant memory.
+    Incremental counterpart of the window differences, relative angles and offline Gaussian mixture fits of the
+    Voltage Change Detection and Phase Angle Monitoring notebooks.
+
+    Each channel goes through the following steps:
+    1. Phase angles are unwrapped across chunks (period) and taken relative to a reference channel (reference).
+    2. The mean and variance of the first warmup valid samples form the baseline of the channel.
+    3. Two sided CUSUM of the standardized samples: an 'increase' or 'decrease' event is emitted when the
+       statistic exceeds h, after which the baseline is learned again from the following samples.
+    4. Optionally, an online Gaussian mixture of the samples of the channel (n_components > 0): a 'regime' event
+       is emitted when the samples move to another component for at least regime_hold samples.
+
+    The CUSUM events do not depend on how the data is split into chunks. The mixture is updated once per chunk,
+    so the regime events depend slightly on the chunk size.
+
+    Parameters
+    ----------
+    k : float, default=1.0
+        Allowance of the CUSUM in standard deviations, about half the smallest shift to detect.
+    h : float, default=10.0
+        Threshold of the CUSUM in standard deviations. Higher values give fewer false alarms and slower detections.
+    warmup : int, default=300
+        Number of valid samples used to learn the baseline of a channel, at the start and after every event.
+    period : float, default=None
+        Period of the phase angles to unwrap (360 for degrees). Values are not unwrapped if None.
+    reference : int, default=None
+        Index of the channel subtracted from all the channels, e.g. the angle of a reference PMU.
+    n_components : int, default=0
+        Number of components of the mixture of each channel. Regimes are not tracked if 0.
+    regime_hold : int, default=30
+        Number of consecutive samples in another component before a 'regime' event.
+    min_std : float, default=1e-6
+        Floor of the standard deviation of the baselines.
+    decay : float, default=0.6
+        Decay of the step size of the mixture, see OnlineGaussianMixture.
+
+    Examples
+    ----------
+    >>> detector = ChangeDetector(k=1.0, h=10, warmup=600)
+    >>> for times, values, columns in iter_streams_chunks(voltage_streams, start, end, chunk_ns=ns_delta(minutes=10),
+    ...                                                   as_array=True):
+    ...     events = detector.update(times, values, columns)
+    >>> detector.checkpoint('detector.npz')
+    # later on, resume where it stopped
+    >>> detector = ChangeDetector.from_checkpoint('detector.npz')
+    """
+    ARRAYS = ('n', 'mean', 'm2', 's_pos', 's_neg', 'start_pos', 'start_neg', 'regime', 'candidate', 'run',
+              'run_start')
+
+    def __init__(self, k=1.0, h=10.0, warmup=300, period=None, reference=None, n_components=0, regime_hold=30,
+                 min_std=1e-6, decay=0.6):
+        if warmup < 2:
+            raise ValueError('warmup must be at least 2 samples.')
+        self.k = k
+        self.h = h
+        self.warmup = warmup
+        self.period = period
+        self.reference = reference
+        self.n_components = n_components
+        self.regime_hold = regime_hold
+        self.min_std = min_std
+        self.decay = decay
+        self.columns = []
+        self.unwrap = RunningUnwrap(period) if period is not None else None
+        self.mixture = OnlineGaussianMixture(n_components, decay=decay) if n_components > 0 else None
+        for name in self.ARRAYS:
+            setattr(self, name, np.array([], dtype=np.float64 if name in ('mean', 'm2', 's_pos', 's_neg')
+                                         else np.int64))
+
+    def _config(self):
+        return {'k': self.k, 'h': self.h, 'warmup': self.warmup, 'period': self.period, 'reference': self.reference,
+                'n_components': self.n_components, 'regime_hold': self.regime_hold, 'min_std': self.min_std,
+                'decay': self.decay}
+
+    def _grow(self, n_channels):
+        """
+        Helper function that adds the state of new channels up to n_channels.
+        """
+        n_new = n_channels - len(self.n)
+        if n_new <= 0:
+            return
+        fill = {'start_pos': -1, 'start_neg': -1, 'regime': -1, 'candidate': -1, 'run_start': -1}
+        for name in self.ARRAYS:
+            old = getattr(self, name)
+            setattr(self, name, np.concatenate([old, np.full(n_new, fill.get(name, 0), dtype=old.dtype)]))
+        if self.unwrap is not None and self.unwrap.last is not None:
+            self.unwrap.last = np.hstack([self.unwrap.last, np.full((2, n_new), np.nan)])
+
+    def _reindex(self, values, columns):
+        """
+        Helper function that places the columns of a chunk at the index of their channel,
+        with NaN for the known channels missing from the chunk.
+        """
+        if columns is None:
+            if len(self.columns) > 0:
+                raise ValueError('columns must be specified, the detector was fed with labeled columns.')
+            self._grow(values.shape[1])
+            if values.shape[1] < len(self.n):
+                values = np.hstack([values, np.full((len(values), len(self.n) - values.shape[1]), np.nan)])
+            return values
+        if len(self.columns) == 0 and len(self.n) > 0:
+            raise ValueError('columns cannot be specified, the detector was fed with unlabeled columns.')
+        index = {column: i for i, column in enumerate(self.columns)}
+        for column in columns:
+            if column not in index:
+                index[column] = len(self.columns)
+                self.columns.append(column)
+        self._grow(len(self.columns))
+        full = np.full((len(values), len(self.columns)), np.nan)
+        full[:, [index[column] for column in columns]] = values
+        return full
+
+    def _baseline(self, channel, x):
+        """
+        Helper function that merges the valid samples x into the running mean and variance of a channel
+        (Chan et al. parallel update of Welford's algorithm).
+        """
+        x = x[~np.isnan(x)]
+        if len(x) == 0:
+            return
+        n_a, n_b = self.n[channel], len(x)
+        mean_b = x.mean()
+        delta = mean_b - self.mean[channel]
+        n = n_a + n_b
+        self.mean[channel] += delta * n_b / n
+        self.m2[channel] += np.square(x - mean_b).sum() + delta ** 2 * n_a * n_b / n
+        self.n[channel] = n
+
+    def _restart(self, channel):
+        self.n[channel] = 0
+        self.mean[channel] = self.m2[channel] = 0.0
+        self.s_pos[channel] = self.s_neg[channel] = 0.0
+        self.start_pos[channel] = self.start_neg[channel] = -1
+
+    def _detect(self, channel, times, x, events):
+        """
+        Helper function that runs the baseline and CUSUM of one channel over a chunk and appends its events.
+        """
+        # blocks bound the work redone after each event, which would otherwise grow with the chunk size
+        for block in range(0, len(x), DETECT_BLOCK):
+            self._detect_block(channel, times[block:block + DETECT_BLOCK], x[block:block + DETECT_BLOCK], events)
+
+    def _detect_block(self, channel, times, x, events):
+        position = 0
+        while position < len(x):
+            if self.n[channel] < self.warmup:
+                # the baseline takes the next valid samples until it has enough of them
+                valid = np.flatnonzero(~np.isnan(x[position:]))
+                needed = self.warmup - self.n[channel]
+                stop = len(x) if len(valid) < needed else position + valid[needed - 1] + 1
+                self._baseline(channel, x[position:stop])
+                position = stop
+                continue
+
+            std = max(np.sqrt(self.m2[channel] / (self.n[channel] - 1)), self.min_std)
+            segment = x[position:]
+            z = (segment - self.mean[channel]) / std
+            valid = ~np.isnan(z)
+            s_pos = cusum(np.where(valid, z - self.k, 0), self.s_pos[channel])
+            s_neg = cusum(np.where(valid, -z - self.k, 0), self.s_neg[channel])
+            alarms = np.flatnonzero((s_pos > self.h) | (s_neg > self.h))
+            stop = len(segment) if len(alarms) == 0 else alarms[0] + 1
+
+            # start of the current excursion of each statistic: the sample after it was last 0
+            for s, name in ((s_pos, 'start_pos'), (s_neg, 'start_neg')):
+                zeros = np.flatnonzero(s[:stop] == 0)
+                if len(zeros) > 0:
+                    after = zeros[-1] + 1
+                    getattr(self, name)[channel] = times[position + after] if after < stop else -1
+                elif getattr(self, name)[channel] == -1:
+                    getattr(self, name)[channel] = times[position]
+
+            if len(alarms) == 0:
+                self.s_pos[channel], self.s_neg[channel] = s_pos[-1], s_neg[-1]
+                return
+            i = alarms[0]
+            increase = s_pos[i] >= s_neg[i]
+            events.append((times[position + i],
+                           self.start_pos[channel] if increase else self.start_neg[channel],
+                           channel, 'increase' if increase else 'decrease', segment[i], self.mean[channel],
+                           s_pos[i] if increase else s_neg[i], -1))
+            self._restart(channel)
+            position += i + 1
+
+    def _regimes(self, times, values, events):
+        """
+        Helper function that updates the mixture with a chunk and appends the regime events.
+        """
+        self.mixture.update(values)
+        labels = self.mixture.predict(values)
+        for channel in range(labels.shape[1]):
+            valid = np.flatnonzero(labels[:, channel] >= 0)
+            if len(valid) == 0:
+                continue
+            label = labels[valid, channel]
+            # runs of consecutive valid samples with the same component
+            starts = np.flatnonzero(np.diff(label, prepend=label[0] - 1) != 0)
+            lengths = np.diff(np.append(starts, len(label)))
+            for start, length in zip(starts, lengths):
+                component = label[start]
+                if component == self.candidate[channel]:
+                    run = self.run[channel] + length
+                else:
+                    run = length
+                    self.candidate[channel] = component
+                    self.run_start[channel] = times[valid[start]]
+                self.run[channel] = run
+
+                if component == self.regime[channel] or run < self.regime_hold:
+                    continue
+                if self.regime[channel] >= 0:
+                    # sample at which the run reached regime_hold
+                    confirmed = valid[start + self.regime_hold - 1 - (run - length)]
+                    events.append((times[confirmed], self.run_start[channel], channel, 'regime',
+                                   self.mixture.means_[channel, component],
+                                   self.mixture.means_[channel, self.regime[channel]], run, component))
+                self.regime[channel] = component
+
+    def update(self, times, values, columns=None):
+        """
+        Processes a chunk of data, which must come after the previous chunks.
+
+        Parameters
+        ----------
+        times : numpy.array of int64
+            Timestamps of the chunk in nanoseconds.
+        values : numpy.array of float64
+            (n_samples, n_channels) values of the chunk, NaN for missing values.
+        columns : list, default=None
+            Label of each column, e.g. the columns yielded by iter_streams_chunks(as_array=True).
+            Channels are then matched by label across chunks, so that the streams missing from a chunk are skipped.
+            Channels are matched by position if None.
+
+        Returns
+        ----------
+        events : dict of numpy.array
+            Events of the chunk sorted by time: 'time' of the detection, 'start' time of the change (-1 if unknown),
+            'channel' index, 'kind' ('increase', 'decrease' or 'regime'), 'value' (the sample, or the mean of the new
+            component), 'baseline' (the baseline mean, or the mean of the previous component), 'score' (CUSUM
+            statistic, or length of the new regime in samples) and 'label' (new component, -1 for CUSUM events).
+        """
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        if len(times) != len(values):
+            raise ValueError('times and values must have the same number of samples.')
+        values = self._reindex(values, columns)
+
+        if self.unwrap is not None:
+            values = self.unwrap.update(values)
+        if self.reference is not None:
+            values = values - values[:, [self.reference]]
+
+        events = []
+        if len(times) > 0:
+            for channel in range(values.shape[1]):
+                self._detect(channel, times, values[:, channel], events)
+            if self.mixture is not None:
+                self._regimes(times, values, events)
+        return _events(events)
+
+    def checkpoint(self, path=None):
+        """
+        Returns the whole state of the detector as a dict of NumPy arrays, and saves it to path (a .npz file) if given.
+        Labeled columns must be JSON serializable, e.g. the tuples of iter_streams_chunks().
+        """
+        state = {'config': json.dumps(self._config()), 'columns': json.dumps(self.columns)}
+        for name in self.ARRAYS:
+            state[name] = getattr(self, name)
+        if self.unwrap is not None and self.unwrap.last is not None:
+            state['unwrap_last'] = self.unwrap.last
+        if self.mixture is not None and self.mixture._steps is not None:
+            for name, value in self.mixture.state().items():
+                if isinstance(value, np.ndarray):
+                    state['mixture_' + name] = value
+        if path is not None:
+            np.savez(path, **state)
+        return state
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        """
+        Returns a detector restored from the state returned or saved by checkpoint(), either the dict or the path.
+        """
+        if isinstance(checkpoint, dict):
+            state = checkpoint
+        else:
+            with np.load(checkpoint, allow_pickle=False) as f:
+                state = {name: f[name] for name in f.files}
+        detector = cls(**json.loads(str(state['config'])))
+        detector.columns = [tuple(c) if isinstance(c, list) else c for c in json.loads(str(state['columns']))]
+        for name in cls.ARRAYS:
+            setattr(detector, name, np.array(state[name], dtype=getattr(detector, name).dtype))
+        if detector.unwrap is not None and 'unwrap_last' in state:
+            detector.unwrap.last = np.array(state['unwrap_last'], dtype=np.float64)
+        if detector.mixture is not None and 'mixture_steps' in state:
+            detector.mixture.load_state({**detector.mixture.state(),
+                                         **{name: np.array(state['mixture_' + name]) for name in
+                                            ('weights', 'means', 'vars', 'stats', 'steps')}})
+        return detector
+
+
+def _events(events):
+    """
+    Helper function that converts a list of event tuples into a dict of arrays sorted by time.
+    """
+    if len(events) == 0:
+        return _empty_events()
+    empty = _empty_events()
+    result = {name: np.array(column, dtype=empty[name].dtype) for name, column in zip(EVENT_FIELDS, zip(*events))}
+    order = np.argsort(result['time'], kind='stable')
+    return {name: column[order] for name, column in result.items()}
+
+
+def monitor_streams(streams, start, end, detector=None, chunk_ns=None, chunk_points=None, **kwargs):
+    """
+    Runs a ChangeDetector over streams chunk by chunk and yields the events of each chunk as soon as it is processed,
+    for continuous monitoring without loading the whole time range.
+
+    Parameters
+    ----------
+    streams : btrdb.Stream, [btrdb.Stream], or btrdb.Stream.Streamset
+        Streams to monitor. Use agg=['mean'] with pw or width to monitor stat points.
+    start : int or float
+        Start time in nanoseconds.
+    end : int or float
+        End time in nanoseconds.
+    detector : ChangeDetector, default=None
+        Detector to feed, e.g. restored from a checkpoint. A new ChangeDetector() if None.
+    chunk_ns, chunk_points :
+        Size of the chunks, see iter_streams_chunks().
+    kwargs :
+        Other parameters of iter_streams_chunks() (pw, width, depth, agg, sample_rate, max_workers, align, ...).
+
+    Yields
+    ----------
+    (events, columns) : (dict of numpy.array, list of tuple)
+        Events of each chunk (see ChangeDetector.update()) and the label of every channel seen so far.
+
+    Examples
+    ----------
+    >>> detector = ChangeDetector(period=360, reference=0, n_components=2)
+    >>> for events, columns in monitor_streams(angle_streams, start, end, detector, chunk_ns=ns_delta(minutes=10),
+    ...                                        pw=25, agg=['mean']):
+    ...     for time, channel, kind in zip(events['time'], events['channel'], events['kind']):
+    ...         print(time, columns[channel], kind)
+    """
+    detector = ChangeDetector() if detector is None else detector
+    for times, values, columns in iter_streams_chunks(streams, start, end, chunk_ns=chunk_ns, chunk_points=chunk_points,
+                                                      as_array=True, **kwargs):
+        yield detector.update(times, values, columns), detector.columns
@@ -0,0 +1,292 @@
+import btrdb
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import points_to_columns
+
+
+def _empty_events():
+    return (np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+            np.array([], dtype=np.float64), np.array([], dtype=np.int64))
+
+
+class EventConsolidator(object):
+    """
+    Incrementally groups threshold points (e.g. sag points) into distinct events based on the time between them.
+    Points less than `gap` nanoseconds after the last point of an event belong to that event.
+    Chunks must be passed in time order; the event still open at the end of a chunk is carried over to the next one.
+
+    Parameters
+    ----------
+    gap : int or float
+        Time gap threshold in nanoseconds. Adjacent points less than this value apart are combined into a single event.
+    below : bool, default=True
+        Keep the minimum value of each event as its magnitude if True (sags), the maximum otherwise (swells).
+
+    Examples
+    ----------
+    >>> consolidator = EventConsolidator(gap=1e9)
+    >>> for idx, times, values in iter_threshold_batches(stream, thresh, start, end):
+    ...     starts, durations, magnitudes, counts = consolidator.update(times, values)
+    >>> starts, durations, magnitudes, counts = consolidator.flush()
+    """
+    def __init__(self, gap, below=True):
+        self.gap = gap
+        self.below = below
+        # start, last time, magnitude and point count of the event still open
+        self._open = None
+
+    def update(self, times, values):
+        """
+        Adds a chunk of points and returns the events completed by it.
+
+        Parameters
+        ----------
+        times : numpy.array of int64
+            Sorted timestamps of the points in nanoseconds.
+        values : numpy.array of float64
+            Values of the points.
+
+        Returns
+        ----------
+        starts : numpy.array of int64
+            Starting timestamps of the completed events.
+        durations : numpy.array of int64
+            Time duration of each event in nanoseconds.
+        magnitudes : numpy.array of float64
+            Minimum (or maximum) value of each event.
+        counts : numpy.array of int64
+            Number of points in each event.
+        """
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(times) == 0:
+            return _empty_events()
+
+        # index of the first point of each run of points closer than the gap
+        firsts = np.r_[0, np.nonzero(np.diff(times) > self.gap)[0] + 1]
+        lasts = np.r_[firsts[1:] - 1, len(times) - 1]
+        reduce = np.minimum if self.below else np.maximum
+        starts = times[firsts]
+        ends = times[lasts]
+        magnitudes = reduce.reduceat(values, firsts)
+        counts = np.diff(np.r_[firsts, len(times)])
+
+        if self._open is not None:
+            open_start, open_last, open_magnitude, open_count = self._open
+            if times[0] - open_last <= self.gap:
+                # the first run continues the open event
+                starts[0] = open_start
+                magnitudes[0] = reduce(magnitudes[0], open_magnitude)
+                counts[0] += open_count
+            else:
+                starts = np.r_[open_start, starts]
+                ends = np.r_[open_last, ends]
+                magnitudes = np.r_[open_magnitude, magnitudes]
+                counts = np.r_[open_count, counts]
+
+        # the last run may continue in the next chunk
+        self._open = (int(starts[-1]), int(ends[-1]), float(magnitudes[-1]), int(counts[-1]))
+        return starts[:-1], (ends - starts)[:-1], magnitudes[:-1], counts[:-1]
+
+    def flush(self):
+        """
+        Returns the event still open, if any, and resets the state. Call it once the last chunk has been added.
+        """
+        if self._open is None:
+            return _empty_events()
+        start, last, magnitude, count = self._open
+        self._open = None
+        return (np.array([start], dtype=np.int64), np.array([last - start], dtype=np.int64),
+                np.array([magnitude], dtype=np.float64), np.array([count], dtype=np.int64))
+
+
+def consolidate_events(chunks, gap_in_sec=1, below=True):
+    """
+    Consolidates a stream of threshold points into distinct events. Vectorized replacement of sag_survey().
+
+    Parameters
+    ----------
+    chunks : iterable of (times, values) or (stream_indices, times, values)
+        Chunks of points in time order, e.g. the batches yielded by iter_threshold_batches().
+    gap_in_sec : int or float, default=1
+        Time gap threshold in seconds. Adjacent points less than this value apart are combined into a single event.
+    below : bool, default=True
+        Keep the minimum value of each event as its magnitude if True, the maximum otherwise.
+
+    Returns
+    ----------
+    events : dict
+        Maps each stream index (0 for (times, values) chunks) to a tuple of numpy arrays
+        (starts, durations, magnitudes, counts), see EventConsolidator.update().
+
+    Examples
+    ----------
+    >>> batches = iter_threshold_batches(streams, thresholds, start=start, end=end)
+    >>> events = consolidate_events(batches, gap_in_sec=1)
+    >>> starts, durations, magnitudes, counts = events[0]
+    """
+    consolidators = {}
+    found = {}
+
+    def add(ith_stream, times, values):
+        if ith_stream not in consolidators:
+            consolidators[ith_stream] = EventConsolidator(gap_in_sec * 1e9, below=below)
+            found[ith_stream] = []
+        found[ith_stream].append(consolidators[ith_stream].update(times, values))
+
+    for chunk in chunks:
+        if len(chunk) == 2:
+            add(0, *chunk)
+            continue
+        indices, times, values = (np.asarray(c) for c in chunk)
+        # split the chunk per stream, keeping the time order within each stream
+        order = np.argsort(indices, kind='stable')
+        streams, firsts = np.unique(indices[order], return_index=True)
+        for ith_stream, rows in zip(streams.tolist(), np.split(order, firsts[1:])):
+            add(ith_stream, times[rows], values[rows])
+
+    events = {}
+    for ith_stream, consolidator in consolidators.items():
+        found[ith_stream].append(consolidator.flush())
+        events[ith_stream] = tuple(np.concatenate(arrays) for arrays in zip(*found[ith_stream]))
+    return events
+
+
+def merge_event_windows(stream_index, starts, ends, max_gap=0):
+    """
+    Merges the overlapping (or closer than max_gap) windows of each stream into the ranges to query.
+
+    Parameters
+    ----------
+    stream_index : numpy.array of int
+        Stream of each window.
+    starts : numpy.array of int64
+        Start time of each window in nanoseconds.
+    ends : numpy.array of int64
+        End time of each window in nanoseconds (exclusive).
+    max_gap : int, default=0
+        Windows separated by at most this many nanoseconds are also merged, gap included.
+
+    Returns
+    ----------
+    ranges : list of (int, int, int)
+        (stream index, start, end) of each merged range.
+    window_range : numpy.array of int64
+        Index in ranges of the range containing each window.
+    """
+    order = np.lexsort((starts, stream_index))
+    window_range = np.empty(len(starts), dtype=np.int64)
+    ranges = []
+    streams, firsts = np.unique(stream_index[order], return_index=True)
+    for ith_stream, rows in zip(streams.tolist(), np.split(order, firsts[1:])):
+        s, e = starts[rows], ends[rows]
+        # a window starts a new range if it begins after the end of every previous window of the stream
+        reach = np.maximum.accumulate(e)
+        new = np.r_[True, s[1:] > reach[:-1] + max_gap]
+        ids = np.cumsum(new) - 1
+        range_ends = np.maximum.reduceat(e, np.nonzero(new)[0])
+        window_range[rows] = len(ranges) + ids
+        ranges.extend((ith_stream, rs, re) for rs, re in zip(s[new].tolist(), range_ends.tolist()))
+    return ranges, window_range
+
+
+def get_events_data(streams, event_times, window_in_sec_left=0.5, window_in_sec_right=0.5, stream_index=None,
+                    version=0, max_gap=0, max_workers=8, cache=None):
+    """
+    Batch version of get_event_data(): returns the raw values of many windows around event times, in one
+    contiguous time buffer and one contiguous value buffer with an offsets index.
+    Overlapping windows of the same stream are merged into a single range, all the ranges are queried concurrently,
+    and the windows are gathered from them in one vectorized copy, without any per-window allocation.
+
+    Parameters
+    ----------
+    streams : btrdb.Stream, [btrdb.Stream], or btrdb.Stream.Streamset
+        Streams to extract the windows from.
+    event_times : numpy.array of int
+        Event times in nanoseconds.
+    window_in_sec_left : int, float or numpy.array, default=0.5
+        Duration (in seconds) preceding each event time, for all the events or per event.
+    window_in_sec_right : int, float or numpy.array, default=0.5
+        Duration (in seconds) following each event time, for all the events or per event.
+    stream_index : numpy.array of int, default=None
+        Index in streams of the stream of each event. If None, every event is extracted from every stream,
+        stream by stream (window i * len(event_times) + j is event j of stream i).
+    version : int, default=0
+        Stream version.
+    max_gap : int, default=0
+        Windows of the same stream separated by at most this many nanoseconds are also fetched with a single query.
+    max_workers : int, default=8
+        Maximum number of queries running at the same time.
+    cache : library.cache.QueryCache, default=None
+        Local query cache to read the merged ranges from.
+
+    Returns
+    ----------
+    times : numpy.array of int64
+        Timestamps of all the windows, one after another, in nanoseconds.
+    values : numpy.array of float64
+        Values of all the windows, one after another.
+    offsets : numpy.array of int64
+        Window k is times[offsets[k]:offsets[k + 1]] and values[offsets[k]:offsets[k + 1]],
+        in the order of the events. np.split(values, offsets[1:-1]) returns the views of every window.
+
+    Examples
+    ----------
+    >>> times, values, offsets = get_events_data(streams, sag_times, 0.1, 0.4, stream_index=sag_streams)
+    >>> lengths = np.diff(offsets)
+    >>> first_window = values[offsets[0]:offsets[1]]
+    """
+    if isinstance(streams, btrdb.stream.Stream):
+        streams = [streams]
+    streams = list(streams)
+    event_times = np.asarray(event_times, dtype=np.int64).ravel()
+    left = np.broadcast_to(np.round(np.asarray(window_in_sec_left, dtype=np.float64) * 1e9).astype(np.int64),
+                           event_times.shape)
+    right = np.broadcast_to(np.round(np.asarray(window_in_sec_right, dtype=np.float64) * 1e9).astype(np.int64),
+                            event_times.shape)
+    if stream_index is None:
+        stream_index = np.repeat(np.arange(len(streams)), len(event_times))
+        event_times, left, right = (np.tile(a, len(streams)) for a in (event_times, left, right))
+    else:
+        stream_index = np.asarray(stream_index, dtype=np.int64).ravel()
+        if stream_index.shape != event_times.shape:
+            raise ValueError('stream_index must have one stream per event time.')
+    starts, ends = event_times - left, event_times + right
+    if len(starts) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float64), np.zeros(1, dtype=np.int64)
+
+    ranges, window_range = merge_event_windows(stream_index, starts, ends, max_gap=max_gap)
+
+    def query(task):
+        ith_stream, start, end = task
+        if cache is not None:
+            columns = cache.fetch(streams[ith_stream], start, end, version=version)
+            return np.asarray(columns['time']), np.asarray(columns['value'])
+        times, values = points_to_columns(streams[ith_stream].values(start, end, version), ['value', 'time'])
+        return times, values[:, 0]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(query, ranges))
+
+    # position of each range in the concatenated range buffers
+    range_lengths = np.array([len(t) for t, _ in results], dtype=np.int64)
+    range_offsets = np.r_[0, np.cumsum(range_lengths)]
+    range_times = np.concatenate([t for t, _ in results]).astype(np.int64, copy=False)
+    range_values = np.concatenate([v for _, v in results]).astype(np.float64, copy=False)
+
+    # first and last (exclusive) point of each window inside its range
+    first = np.empty(len(starts), dtype=np.int64)
+    last = np.empty(len(starts), dtype=np.int64)
+    order = np.argsort(window_range, kind='stable')
+    ids, firsts = np.unique(window_range[order], return_index=True)
+    for r, rows in zip(ids.tolist(), np.split(order, firsts[1:])):
+        times = range_times[range_offsets[r]:range_offsets[r + 1]]
+        first[rows] = range_offsets[r] + np.searchsorted(times, starts[rows], side='left')
+        last[rows] = range_offsets[r] + np.searchsorted(times, ends[rows], side='left')
+
+    lengths = last - first
+    offsets = np.r_[0, np.cumsum(lengths)].astype(np.int64)
+    # gather index of every output point: consecutive positions starting at the first point of its window
+    gather = np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1] - first, lengths)
+    return range_times[gather], range_values[gather], offsets
@@ -0,0 +1,506 @@
+import re
+import time
+import uuid as uuidlib
+import threading
+
+import btrdb
+import numpy as np
+from btrdb.point import RawPoint, StatPoint
+from btrdb.utils.timez import to_nanoseconds
+
+
+MERGE_POLICIES = ('never', 'equal', 'retain', 'replace')
+
+
+def _window_stats(times, values, start, width, n_windows):
+    """
+    Helper function that computes the StatPoints of the non empty windows [start + i * width, start + (i + 1) * width)
+    of sorted raw values, in a few vectorized passes.
+    """
+    if len(times) == 0 or n_windows <= 0:
+        return []
+    bins = (times - start) // width
+    keep = (bins >= 0) & (bins < n_windows)
+    bins, values = bins[keep], values[keep]
+    if len(bins) == 0:
+        return []
+    # the values are sorted by time, so each window is a contiguous run of bins
+    first = np.r_[0, np.nonzero(np.diff(bins))[0] + 1]
+    counts = np.diff(np.r_[first, len(bins)])
+    sums = np.add.reduceat(values, first)
+    means = sums / counts
+    variances = np.maximum(np.add.reduceat(np.square(values), first) / counts - np.square(means), 0)
+    mins = np.minimum.reduceat(values, first)
+    maxs = np.maximum.reduceat(values, first)
+    window_times = start + bins[first] * width
+    return [StatPoint(int(t), mn, mean, mx, int(c), sd) for t, mn, mean, mx, c, sd
+            in zip(window_times.tolist(), mins.tolist(), means.tolist(), maxs.tolist(), counts.tolist(),
+                   np.sqrt(variances).tolist())]
+
+
+class FakeStream(btrdb.stream.Stream):
+    """
+    In-memory stand-in for a btrdb.Stream, holding its points in sorted NumPy arrays.
+    Queries return the same (RawPoint, version) and (StatPoint, version) lists as a BTrDB server,
+    after sleeping for the simulated latency of the connection.
+    Instances are created by FakeBTrDB.create() or by the synthetic data generators of FakeBTrDB.
+    """
+    def __init__(self, conn, uuid, collection, tags=None, annotations=None):
+        super().__init__(conn, uuid, known_to_exist=True, collection=collection, tags=dict(tags or {}),
+                         annotations=dict(annotations or {}), property_version=0)
+        self._lock = threading.Lock()
+        self._times = np.array([], dtype=np.int64)
+        self._values = np.array([], dtype=np.float64)
+        self._version = 0
+
+    def refresh_metadata(self):
+        pass
+
+    def exists(self):
+        return True
+
+    def version(self, **kwargs):
+        return self._version
+
+    def _range(self, start, end):
+        start, end = to_nanoseconds(start), to_nanoseconds(end)
+        i, j = np.searchsorted(self._times, [start, end])
+        return self._times[i:j], self._values[i:j]
+
+    def count(self, start=btrdb.MINIMUM_TIME, end=btrdb.MAXIMUM_TIME, pointwidth=62, precise=False, version=0):
+        times, _ = self._range(start, end)
+        self._btrdb._roundtrip(0)
+        return len(times)
+
+    def values(self, start, end, version=0, **kwargs):
+        times, values = self._range(start, end)
+        self._btrdb._roundtrip(len(times))
+        version = self._version
+        return [(RawPoint(t, v), version) for t, v in zip(times.tolist(), values.tolist())]
+
+    def aligned_windows(self, start, end, pointwidth, version=0, **kwargs):
+        # as on the server, the start is truncated to the window width and every window starting before end is returned
+        width = 1 << int(pointwidth)
+        start, end = to_nanoseconds(start), to_nanoseconds(end)
+        start = start - start % width
+        n_windows = max(-((start - end) // width), 0)
+        times, values = self._range(start, start + n_windows * width)
+        points = _window_stats(times, values, start, width, n_windows)
+        self._btrdb._roundtrip(len(points))
+        return [(point, self._version) for point in points]
+
+    def windows(self, start, end, width, depth=0, version=0, **kwargs):
+        # only the windows that fit entirely in [start, end) are returned
+        width = int(width)
+        start, end = to_nanoseconds(start), to_nanoseconds(end)
+        n_windows = (end - start) // width
+        times, values = self._range(start, start + n_windows * width)
+        points = _window_stats(times, values, start, width, n_windows)
+        self._btrdb._roundtrip(len(points))
+        return [(point, self._version) for point in points]
+
+    def earliest(self, version=0, **kwargs):
+        self._btrdb._roundtrip(1)
+        if len(self._times) == 0:
+            return None
+        return RawPoint(int(self._times[0]), float(self._values[0])), self._version
+
+    def latest(self, version=0, **kwargs):
+        self._btrdb._roundtrip(1)
+        if len(self._times) == 0:
+            return None
+        return RawPoint(int(self._times[-1]), float(self._values[-1])), self._version
+
+    def nearest(self, time, version=0, backward=False, **kwargs):
+        self._btrdb._roundtrip(1)
+        time = to_nanoseconds(time)
+        i = np.searchsorted(self._times, time, side='right' if backward else 'left') - (1 if backward else 0)
+        if i < 0 or i >= len(self._times):
+            return None
+        return RawPoint(int(self._times[i]), float(self._values[i])), self._version
+
+    def set_data(self, times, values):
+        """
+        Replaces all the points of the stream with sorted int64 times and float64 values, without any latency.
+        """
+        order = np.argsort(times, kind='stable')
+        with self._lock:
+            self._times = np.asarray(times, dtype=np.int64)[order]
+            self._values = np.asarray(values, dtype=np.float64)[order]
+            self._version += 1
+        return self._version
+
+    def insert(self, data, merge='never'):
+        if merge not in MERGE_POLICIES:
+            raise ValueError(f'merge must be one of {MERGE_POLICIES}.')
+        self._btrdb._roundtrip(len(data))
+        times = np.fromiter((p[0] for p in data), dtype=np.int64, count=len(data))
+        values = np.fromiter((p[1] for p in data), dtype=np.float64, count=len(data))
+        with self._lock:
+            old_times, old_values = self._times, self._values
+            if merge == 'replace':
+                keep = ~np.isin(old_times, times)
+                old_times, old_values = old_times[keep], old_values[keep]
+            elif merge == 'retain':
+                keep = ~np.isin(times, old_times)
+                times, values = times[keep], values[keep]
+            elif merge == 'equal':
+                existing = set(zip(old_times.tolist(), old_values.tolist()))
+                keep = np.array([p not in existing for p in zip(times.tolist(), values.tolist())], dtype=bool)
+                times, values = times[keep], values[keep]
+            all_times = np.r_[old_times, times]
+            order = np.argsort(all_times, kind='stable')
+            self._times = all_times[order]
+            self._values = np.r_[old_values, values][order]
+            self._version += 1
+            return self._version
+
+    def delete(self, start, end):
+        self._btrdb._roundtrip(0)
+        start, end = to_nanoseconds(start), to_nanoseconds(end)
+        with self._lock:
+            keep = (self._times < start) | (self._times >= end)
+            self._times, self._values = self._times[keep], self._values[keep]
+            self._version += 1
+            return self._version
+
+    def update(self, tags=None, annotations=None, collection=None, encoder=None, replace=False, **kwargs):
+        self._btrdb._roundtrip(0)
+        if tags is not None:
+            self._tags.update(tags)
+        if collection is not None:
+            self._collection = collection
+        if annotations is not None:
+            self._annotations = dict(annotations) if replace else {**self._annotations, **annotations}
+        self._property_version += 1
+        return self._property_version
+
+    def flush(self):
+        pass
+
+
+def _similar_to(pattern):
+    """
+    Helper function that converts a SQL `similar to` pattern into a compiled regular expression.
+    """
+    regex = ''.join('.*' if c == '%' else '.' if c == '_' else c if c in '|()' else re.escape(c) for c in pattern)
+    return re.compile(f'(?:{regex})$', re.DOTALL)
+
+
+class FakeBTrDB(btrdb.conn.BTrDB):
+    """
+    In-process stand-in for a BTrDB connection, with synthetic PMU and point-on-wave data and simulated latency,
+    so that the library can be exercised and benchmarked without a server.
+
+    The queries of the library are supported: values(), aligned_windows(), windows(), earliest(), latest(),
+    insert() and the metadata calls of the connection (streams(), streams_in_collection(), collection_metadata(),
+    list_collections() and query() on the streams table, with `similar to`, `in`, `=` and `annotations -> 'key'`
+    conditions joined by `and`).
+
+    Parameters
+    ----------
+    latency : float, default=0.0
+        Seconds added to every call, as the round trip to a server.
+    bandwidth : float, default=None
+        Points transferred per second. Calls also sleep len(points) / bandwidth seconds. Unlimited if None.
+    seed : int, default=0
+        Seed of the synthetic data and of the stream uuids.
+
+    Examples
+    ----------
+    >>> db = FakeBTrDB(latency=0.005, bandwidth=5e6)
+    >>> streams = db.add_pmu('sunshine/PMU1', start, ns_delta(minutes=10), sags=[(start + ns_delta(minutes=2), 5e8, 0.3)])
+    >>> df = streams_to_df(streams, start, start + ns_delta(minutes=10), pw=30)
+    """
+    def __init__(self, latency=0.0, bandwidth=None, seed=0):
+        # no endpoint, the methods used by the library are all implemented in memory
+        self.ep = None
+        self._ARROW_ENABLED = False
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def _roundtrip(self, n_points):
+        """
+        Counts a call and sleeps for its simulated duration. Sleeping releases the GIL, like waiting for a server.
+        """
+        with self._lock:
+            self.calls += 1
+        delay = self.latency + (n_points / self.bandwidth if self.bandwidth else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _uuid(self):
+        with self._lock:
+            return uuidlib.UUID(bytes=self.rng.bytes(16), version=4)
+
+    def info(self):
+        return {'majorVersion': 5, 'minorVersion': 0, 'build': 'fake', 'proxy': {'proxyEndpoints': []}}
+
+    def create(self, uuid, collection, tags=None, annotations=None):
+        uuid = uuidlib.UUID(str(uuid))
+        stream = FakeStream(self, uuid, collection, tags=tags, annotations=annotations)
+        self._streams[uuid] = stream
+        return stream
+
+    def stream_from_uuid(self, uuid):
+        return self._streams[uuidlib.UUID(str(uuid))]
+
+    def streams(self, *identifiers, versions=None, is_collection_prefix=False):
+        streams = []
+        for identifier in identifiers:
+            try:
+                streams.append(self.stream_from_uuid(identifier))
+            except ValueError:
+                # collection/name path
+                collection, _, name = str(identifier).rpartition('/')
+                found = [s for s in self.streams_in_collection(collection, is_collection_prefix=is_collection_prefix)
+                         if s.name == name]
+                if len(found) != 1:
+                    raise ValueError(f'could not identify stream {identifier}')
+                streams.append(found[0])
+        return btrdb.stream.StreamSet(streams)
+
+    def streams_in_collection(self, *collection, is_collection_prefix=True, tags=None, annotations=None):
+        self._roundtrip(0)
+        collections = collection if len(collection) > 0 else ('',)
+        found = []
+        for stream in self._streams.values():
+            if is_collection_prefix:
+                match = any(stream.collection.startswith(c) for c in collections)
+            else:
+                match = stream.collection in collections
+            match &= all(stream._tags.get(k) == v for k, v in (tags or {}).items())
+            match &= all(str(stream._annotations.get(k)) == str(v) for k, v in (annotations or {}).items())
+            if match:
+                found.append(stream)
+        return found
+
+    def list_collections(self, starts_with=''):
+        return sorted({s.collection for s in self._streams.values() if s.collection.startswith(starts_with)})
+
+    def collection_metadata(self, prefix, tags=None, annotations=None):
+        tag_counts = {}
+        annotation_counts = {}
+        for stream in self.streams_in_collection(prefix):
+            for key in stream._tags:
+                tag_counts[key] = tag_counts.get(key, 0) + 1
+            for key in stream._annotations:
+                annotation_counts[key] = annotation_counts.get(key, 0) + 1
+        return tag_counts, annotation_counts
+
+    def _row(self, stream):
+        """
+        Helper function that returns the row of the streams table of a stream.
+        """
+        row = {'uuid': str(stream.uuid), 'collection': stream.collection,
+               'annotations': {k: str(v) for k, v in stream._annotations.items()},
+               'property_version': stream._property_version}
+        for key in ('name', 'unit', 'ingress', 'distiller'):
+            row[key] = stream._tags.get(key, '')
+        return row
+
+    def query(self, stmt, params=[]):
+        """
+        Runs a select statement on the (simulated) streams table. See the class docstring for the supported syntax.
+        """
+        self._roundtrip(0)
+        match = re.match(r'\s*select\s+(distinct\s+)?(.+?)\s+from\s+streams(?:\s+where\s+(.+?))?\s*;?\s*$',
+                         stmt, re.IGNORECASE | re.DOTALL)
+        if match is None:
+            raise ValueError(f'unsupported query: {stmt}')
+        distinct, columns, where = match.groups()
+        param = lambda name: params[int(name.strip().lstrip('$')) - 1]
+
+        conditions = []
+        for condition in re.split(r'\s+and\s+', where or '', flags=re.IGNORECASE) if where else []:
+            condition = condition.strip()
+            m = re.match(r"(?:annotations\s*->\s*'([^']+)'|(\w+))\s+(similar to|in|=|like)\s+(.+)$", condition,
+                         re.IGNORECASE | re.DOTALL)
+            if m is None:
+                raise ValueError(f'unsupported condition: {condition}')
+            annotation, column, op, operand = m.groups()
+            get = (lambda row, a=annotation: row['annotations'].get(a)) if annotation else (lambda row, c=column: row[c])
+            op = op.lower()
+            if op == 'in':
+                allowed = {str(param(p)) for p in operand.strip().strip('()').split(',')}
+                conditions.append(lambda row, get=get, allowed=allowed: str(get(row)) in allowed)
+            elif op == '=':
+                value = str(param(operand))
+                conditions.append(lambda row, get=get, value=value: str(get(row)) == value)
+            else:
+                regex = _similar_to(param(operand).replace('|', '||') if op == 'like' else param(operand))
+                conditions.append(lambda row, get=get, regex=regex: get(row) is not None and
+                                  regex.match(str(get(row))) is not None)
+
+        rows = [self._row(s) for s in self._streams.values()]
+        rows = [row for row in rows if all(condition(row) for condition in conditions)]
+        columns = [c.strip() for c in columns.split(',')]
+        if columns == ['*']:
+            return rows
+
+        results = []
+        for row in rows:
+            expanded = [{}]
+            for column in columns:
+                m = re.match(r'(.+?)(?:\s+as\s+(\w+))?$', column, re.IGNORECASE)
+                expression, alias = m.groups()
+                if expression.lower() == 'skeys(annotations)':
+                    # set returning function, one output row per annotation key
+                    expanded = [{**r, alias or 'skeys': k} for r in expanded for k in row['annotations']]
+                else:
+                    expanded = [{**r, alias or expression: row[expression]} for r in expanded]
+            results.extend(expanded)
+        if distinct:
+            unique = {tuple(sorted(r.items())): r for r in results}
+            results = list(unique.values())
+        return results
+
+    def add_stream(self, collection, name, unit, times, values, annotations=None, **tags):
+        """
+        Creates a stream holding the given points.
+
+        Returns
+        ----------
+        stream : FakeStream
+        """
+        stream = self.create(self._uuid(), collection, tags=dict(name=name, unit=unit, ingress='', **tags),
+                             annotations=annotations)
+        stream.set_data(times, values)
+        return stream
+
+    def add_pmu(self, collection, start, duration, rate=30, nominal_voltage=7200.0, nominal_current=100.0,
+                frequency=60.0, noise=0.001, jitter=0, sags=None, currents=True):
+        """
+        Generates the voltage (L1MAG..L3ANG) and current (C1MAG..C3ANG) phasor streams of a synthetic PMU.
+        The frequency wanders around its nominal value, so the angles rotate slowly, as in real PMU data.
+
+        Parameters
+        ----------
+        collection : str
+            Collection of the streams, e.g. 'sunshine/PMU1'.
+        start : int
+            Time of the first sample in nanoseconds.
+        duration : int
+            Duration of the data in nanoseconds.
+        rate : int or float, default=30
+            Reporting rate in hertz, stored in the sample_rate annotation.
+        nominal_voltage : float, default=7200.0
+            Nominal voltage magnitude in volts.
+        nominal_current : float, default=100.0
+            Nominal current magnitude in amps.
+        frequency : float, default=60.0
+            Nominal frequency in hertz.
+        noise : float, default=0.001
+            Standard deviation of the relative magnitude noise.
+        jitter : int, default=0
+            Maximum random offset of each timestamp in nanoseconds, different for every stream.
+        sags : list of (int, int, float), default=None
+            (time, duration, depth) of voltage sags in nanoseconds, depth being the relative drop (0.3 for 70%).
+            The current rises by the same ratio during each sag.
+        currents : bool, default=True
+            Also generate the current streams.
+
+        Returns
+        ----------
+        streams : list of FakeStream
+            L1MAG, L2MAG, L3MAG, L1ANG, L2ANG, L3ANG, then C1MAG .. C3ANG if currents is True.
+        """
+        start, duration = to_nanoseconds(start), int(duration)
+        times = start + np.round(np.arange(int(duration * rate / 1e9)) * (1e9 / rate)).astype(np.int64)
+        seconds = (times - start) / 1e9
+        drift = np.cumsum(self.rng.normal(0, 0.0005, len(times)))
+        phase = 360 * np.cumsum(np.r_[0, np.diff(seconds)] * drift) % 360
+
+        scale = np.ones(len(times))
+        for sag_time, sag_duration, depth in sags or []:
+            scale[(times >= sag_time) & (times < sag_time + sag_duration)] *= 1 - depth
+
+        annotations = {'sample_rate': str(rate), 'frequency': str(frequency), 'type': 'pmu'}
+        signals = [('L', 'volts', nominal_voltage * scale, 0.0)]
+        if currents:
+            signals.append(('C', 'amps', nominal_current / scale, -20.0))
+
+        streams = []
+        for prefix, unit, magnitude, shift in signals:
+            magnitudes = []
+            angles = []
+            for ith_phase in range(3):
+                values = magnitude * (1 + self.rng.normal(0, noise, len(times)))
+                magnitudes.append(self.add_stream(collection, f'{prefix}{ith_phase + 1}MAG', unit,
+                                                  self._jitter(times, jitter), values, annotations))
+                angle = (phase + shift - 120 * ith_phase + 180) % 360 - 180
+                angles.append(self.add_stream(collection, f'{prefix}{ith_phase + 1}ANG', 'degrees',
+                                              self._jitter(times, jitter), angle, annotations))
+            streams.extend(magnitudes + angles)
+        return streams
+
+    def add_point_on_wave(self, collection, start, duration, rate=50000, amplitude=170.0, frequency=60.0,
+                          harmonics=None, noise=0.002, faults=None, phases=3, unit='volts'):
+        """
+        Generates the waveform streams (A, B, C) of a synthetic point-on-wave recorder.
+
+        Parameters
+        ----------
+        collection : str
+            Collection of the streams, e.g. 'POW/signatures/event1'.
+        start : int
+            Time of the first sample in nanoseconds.
+        duration : int
+            Duration of the data in nanoseconds.
+        rate : int or float, default=50000
+            Sample rate in hertz, stored in the sample_rate annotation.
+        amplitude : float, default=170.0
+            Peak amplitude of the fundamental.
+        frequency : float, default=60.0
+            Frequency of the fundamental in hertz.
+        harmonics : dict, default=None
+            Maps harmonic orders to their amplitude relative to the fundamental, e.g. {3: 0.05, 5: 0.03}.
+        noise : float, default=0.002
+            Standard deviation of the noise relative to the amplitude.
+        faults : list of (int, int, float), default=None
+            (time, duration, magnitude) of faults in nanoseconds. The first phase sags by `magnitude` during the fault,
+            and a decaying oscillation of the same relative magnitude is added at its start.
+        phases : int, default=3
+            Number of phases.
+        unit : str, default='volts'
+            Unit of the streams.
+
+        Returns
+        ----------
+        streams : list of FakeStream
+        """
+        start, duration = to_nanoseconds(start), int(duration)
+        times = start + np.round(np.arange(int(duration * rate / 1e9)) * (1e9 / rate)).astype(np.int64)
+        seconds = (times - start) / 1e9
+        annotations = {'sample_rate': str(rate), 'frequency': str(frequency), 'type': 'fault' if faults else 'wave'}
+
+        streams = []
+        for ith_phase in range(phases):
+            angle = 2 * np.pi * frequency * seconds - 2 * np.pi * ith_phase / phases
+            values = np.sin(angle)
+            for order, relative in (harmonics or {}).items():
+                values += relative * np.sin(order * angle)
+            values *= amplitude
+            values += self.rng.normal(0, noise * amplitude, len(times))
+            if ith_phase == 0:
+                for fault_time, fault_duration, magnitude in faults or []:
+                    during = (times >= fault_time) & (times < fault_time + fault_duration)
+                    values[during] *= 1 - magnitude
+                    after = (times - fault_time) / 1e9
+                    transient = (times >= fault_time) & (after < 0.05)
+                    values[transient] += magnitude * amplitude * np.exp(-after[transient] / 0.005) * \
+                        np.sin(2 * np.pi * 1000 * after[transient])
+            streams.append(self.add_stream(collection, 'ABC'[ith_phase % 3], unit, times, values, annotations))
+        return streams
+
+    def _jitter(self, times, jitter):
+        """
+        Helper function that offsets each timestamp by up to +/- jitter nanoseconds, keeping them sorted.
+        """
+        if jitter <= 0:
+            return times
+        return np.sort(times + self.rng.integers(-jitter, jitter + 1, len(times)))
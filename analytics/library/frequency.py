@@ -0,0 +1,231 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from btrdb.utils.timez import to_nanoseconds
+
+from .utils import points_to_columns
+from .search import coalesce_windows
+
+
+def find_crossing_windows(times, mins, maxs, width, level=0.0, rising=False):
+    """
+    Finds the stat point windows that may contain a crossing of `level`, with vectorized min/max sign tests.
+    A crossing is either inside a window (min <= level <= max) or between two adjacent windows
+    lying on opposite sides of the level. The window preceding each candidate is also returned, so that
+    a crossing between the last point of a window and the first point of the next one is never missed.
+
+    Parameters
+    ----------
+    times : numpy.array of int64
+        Sorted start times of the windows in nanoseconds.
+    mins : numpy.array of float64
+        Minimum of each window.
+    maxs : numpy.array of float64
+        Maximum of each window.
+    width : int
+        Width of the windows in nanoseconds.
+    level : float, default=0.0
+        Level of the crossings.
+    rising : bool, default=False
+        Skip the windows whose neighbours show that they can only contain falling crossings.
+
+    Returns
+    ----------
+    starts : numpy.array of int64
+        Sorted start times of the windows to fetch.
+    """
+    if len(times) == 0:
+        return np.array([], dtype=np.int64)
+    inside = (mins <= level) & (maxs >= level)
+    adjacent = np.r_[False, np.diff(times) == width]
+    prev_min = np.r_[np.nan, mins[:-1]]
+    prev_max = np.r_[np.nan, maxs[:-1]]
+    between = adjacent & (((mins >= level) & (prev_max <= level)) | ((maxs <= level) & (prev_min >= level)))
+    candidates = inside | between
+    if rising:
+        next_adjacent = np.r_[adjacent[1:], False]
+        next_min = np.where(next_adjacent, np.r_[mins[1:], np.nan], np.nan)
+        next_max = np.where(next_adjacent, np.r_[maxs[1:], np.nan], np.nan)
+        prev_min = np.where(adjacent, prev_min, np.nan)
+        prev_max = np.where(adjacent, prev_max, np.nan)
+        # comparisons with NaN are False, so windows without neighbours are kept
+        falling = (prev_min >= level) | (next_max <= level)
+        may_rise = (prev_max <= level) | (next_min >= level)
+        candidates &= ~(falling & ~may_rise)
+    fetch = candidates.copy()
+    fetch[:-1] |= candidates[1:] & adjacent[1:]
+    return times[fetch]
+
+
+def interpolate_crossings(times, values, level=0.0, rising=True, max_gap=None):
+    """
+    Returns the sub-sample times at which raw values cross `level`, by linear interpolation between
+    the two samples on each side of the crossing.
+
+    Parameters
+    ----------
+    times : numpy.array of int64
+        Sorted timestamps of the samples in nanoseconds.
+    values : numpy.array of float64
+        Values of the samples.
+    level : float, default=0.0
+        Level of the crossings.
+    rising : bool, default=True
+        Only return rising crossings if True, rising and falling crossings otherwise.
+    max_gap : int, default=None
+        Ignore crossings between samples further apart than this many nanoseconds (e.g. across data gaps).
+
+    Returns
+    ----------
+    crossings : numpy.array of int64
+        Timestamps of the crossings in nanoseconds.
+    """
+    v = np.asarray(values, dtype=np.float64) - level
+    times = np.asarray(times, dtype=np.int64)
+    if len(v) < 2:
+        return np.array([], dtype=np.int64)
+    up = (v[:-1] < 0) & (v[1:] >= 0)
+    idx = np.nonzero(up if rising else up | ((v[:-1] > 0) & (v[1:] <= 0)))[0]
+    dt = times[idx + 1] - times[idx]
+    if max_gap is not None:
+        keep = dt <= max_gap
+        idx, dt = idx[keep], dt[keep]
+    frac = -v[idx] / (v[idx + 1] - v[idx])
+    # interpolate the offset only, float64 cannot hold absolute timestamps to the nanosecond
+    return times[idx] + np.round(frac * dt).astype(np.int64)
+
+
+class FrequencyTracker(object):
+    """
+    Streaming zero-crossing frequency estimator for point-on-wave streams.
+    Each call to update() processes the next time range: crossing windows are found from stat points,
+    the raw values of all candidate windows are fetched in coalesced, concurrent queries, and the
+    frequency is estimated from the interpolated time between successive rising crossings.
+    The last stat window and the last crossing are carried over, so ranges can be processed one after another.
+
+    Parameters
+    ----------
+    stream : btrdb.Stream
+        Point-on-wave stream.
+    nominal : int or float, default=60
+        Nominal frequency in hertz. Crossings closer than half a nominal period to the previous one are ignored.
+    pw : int, default=None
+        Pointwidth of the stat points used to find the crossings. Defaults to about 1/16 of a nominal period.
+    level : float, default=0.0
+        Level of the crossings, e.g. the DC offset of the waveform.
+    version : int, default=0
+        Stream version.
+    max_workers : int, default=8
+        Maximum number of raw queries running at the same time.
+    merge_gap : int, default=0
+        Candidate windows separated by at most this many nanoseconds are fetched with a single query, gap included.
+        By default only adjacent windows are merged, so that only the raw values around the crossings are transferred;
+        the queries of the candidate ranges run concurrently (max_workers) to hide the round trips.
+
+    Examples
+    ----------
+    >>> tracker = FrequencyTracker(stream, nominal=60)
+    >>> times, freqs = tracker.update(start, start + ns_delta(minutes=10))
+    """
+    def __init__(self, stream, nominal=60, pw=None, level=0.0, version=0, max_workers=8, merge_gap=0):
+        self.stream = stream
+        self.nominal = nominal
+        self.pw = int(np.floor(np.log2(1e9 / nominal / 16))) if pw is None else int(pw)
+        self.level = level
+        self.version = version
+        self.max_workers = max_workers
+        self.min_period = 0.5e9 / nominal
+        self.merge_gap = int(merge_gap)
+        self._last_window = None
+        self._last_crossing = None
+
+    def crossings(self, start, end):
+        """
+        Returns the timestamps (int64 nanoseconds) of the rising crossings in [start, end).
+        """
+        width = 2 ** self.pw
+        times, stats = points_to_columns(self.stream.aligned_windows(start, end, self.pw, self.version),
+                                         ['min', 'max', 'time'])
+        mins, maxs = stats[:, 0], stats[:, 1]
+        if self._last_window is not None:
+            # the last window of the previous range, to catch crossings at the boundary
+            times = np.r_[self._last_window[0], times]
+            mins = np.r_[self._last_window[1], mins]
+            maxs = np.r_[self._last_window[2], maxs]
+        if len(times) == 0:
+            return np.array([], dtype=np.int64)
+        self._last_window = (times[-1], mins[-1], maxs[-1])
+
+        starts = find_crossing_windows(times, mins, maxs, width, self.level, rising=True)
+        ranges = coalesce_windows(starts, width, self.merge_gap)
+        query = lambda r: points_to_columns(self.stream.values(r[0], r[1], self.version), ['value', 'time'])
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(query, ranges))
+
+        crossings = [interpolate_crossings(t, v[:, 0], self.level, max_gap=width) for t, v in results]
+        crossings = np.concatenate(crossings) if len(crossings) > 0 else np.array([], dtype=np.int64)
+        if self._last_crossing is not None:
+            crossings = crossings[crossings > self._last_crossing]
+        return crossings
+
+    def update(self, start, end):
+        """
+        Processes [start, end) and returns the frequency estimates found in it.
+
+        Returns
+        ----------
+        times : numpy.array of int64
+            Timestamp of the crossing ending each period, in nanoseconds.
+        freqs : numpy.array of float64
+            Frequency in hertz, the inverse of the time since the previous crossing.
+        """
+        crossings = self.crossings(start, end)
+        if self._last_crossing is not None:
+            crossings = np.r_[self._last_crossing, crossings]
+        if len(crossings) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        # noise around the level produces bursts of crossings, keep the first of each burst
+        keep = np.r_[True, np.diff(crossings) >= self.min_period]
+        crossings = crossings[keep]
+        self._last_crossing = crossings[-1]
+
+        periods = np.diff(crossings)
+        return crossings[1:], 1e9 / periods
+
+
+def iter_frequency(stream, start, end, chunk_ns=60 * 10**9, nominal=60, pw=None, level=0.0, version=0, max_workers=8,
+                   merge_gap=0):
+    """
+    Generator tracking the frequency of a point-on-wave stream over an arbitrarily long time range, chunk by chunk.
+    See FrequencyTracker for the parameters.
+
+    Parameters
+    ----------
+    start : int, float or str
+        Start time in nanoseconds or as an ISO 8601 string.
+    end : int, float or str
+        End time in nanoseconds or as an ISO 8601 string.
+    chunk_ns : int, default=60 * 10**9
+        Duration of each chunk in nanoseconds, rounded up to a multiple of the stat point width.
+
+    Yields
+    ----------
+    times : numpy.array of int64
+        Timestamp of each frequency estimate in nanoseconds.
+    freqs : numpy.array of float64
+        Frequency estimates in hertz.
+
+    Examples
+    ----------
+    >>> for times, freqs in iter_frequency(stream, start, end, chunk_ns=ns_delta(minutes=5)):
+    ...     ax.plot(times, freqs)
+    """
+    tracker = FrequencyTracker(stream, nominal=nominal, pw=pw, level=level, version=version, max_workers=max_workers,
+                               merge_gap=merge_gap)
+    width = 2 ** tracker.pw
+    chunk_ns = int(np.ceil(chunk_ns / width)) * width
+    start, end = to_nanoseconds(start), to_nanoseconds(end)
+    # chunks start on a window boundary so that no stat window is split between two chunks
+    for chunk_start in range(start - start % width, end, chunk_ns):
+        times, freqs = tracker.update(chunk_start, min(chunk_start + chunk_ns, end))
+        if len(times) > 0:
+            yield times, freqs
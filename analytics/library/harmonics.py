@@ -0,0 +1,195 @@
+import inspect
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from btrdb.utils.timez import to_nanoseconds
+
+from .utils import points_to_columns
+
+
+# numpy >= 2.0 can write the transform into an existing array
+_RFFT_OUT = 'out' in inspect.signature(np.fft.rfft).parameters
+
+class HarmonicAnalyzer(object):
+    """
+    Streaming short-time Fourier transform of a waveform that emits, for every frame, the magnitudes of the
+    fundamental and its harmonics and the total harmonic distortion (THD).
+    Samples can be passed in chunks of any size; the samples of the last incomplete frame are kept for the next chunk.
+    The window, the frame buffer and the spectrum buffers are allocated once and reused for every chunk
+    (with numpy < 2.0, the transform itself still allocates its result before it is copied into them).
+
+    Parameters
+    ----------
+    sample_rate : int or float
+        Sample rate of the waveform in hertz.
+    nfft : int, default=None
+        Number of samples per frame. Defaults to the whole number of fundamental cycles closest to 200 ms
+        (10 cycles at 50 Hz, 12 cycles at 60 Hz, as in IEC 61000-4-7), so that the harmonics fall on exact bins.
+    hop : int, default=None
+        Number of samples between the starts of two frames. Defaults to nfft // 2 (50% overlap).
+    fundamental : int or float, default=60
+        Nominal fundamental frequency in hertz.
+    n_harmonics : int, default=25
+        Number of harmonics reported, the fundamental included. Harmonics above the Nyquist frequency are NaN.
+    window : str or numpy.array, default='hann'
+        'hann', 'hamming', 'blackman', 'rect' or an array of nfft weights.
+    search_bins : int, default=1
+        Number of bins on each side of a harmonic searched for its peak, to tolerate frequency deviations.
+    max_frames : int, default=256
+        Number of frames transformed at once, which bounds the size of the frame buffer.
+    return_spectrum : bool, default=False
+        Also return the full magnitude spectrum of every frame (a spectrogram).
+
+    Examples
+    ----------
+    >>> analyzer = HarmonicAnalyzer(sample_rate=50000, fundamental=50, n_harmonics=40)
+    >>> times, magnitudes, thd = analyzer.update(times, values)
+    """
+    def __init__(self, sample_rate, nfft=None, hop=None, fundamental=60, n_harmonics=25, window='hann',
+                 search_bins=1, max_frames=256, return_spectrum=False):
+        self.sample_rate = sample_rate
+        cycles = max(np.round(0.2 * fundamental), 1)
+        self.nfft = int(np.round(cycles * sample_rate / fundamental)) if nfft is None else int(nfft)
+        self.hop = self.nfft // 2 if hop is None else int(hop)
+        self.fundamental = fundamental
+        self.n_harmonics = n_harmonics
+        self.search_bins = search_bins
+        self.max_frames = max_frames
+        self.return_spectrum = return_spectrum
+
+        if isinstance(window, str):
+            windows = {'hann': np.hanning, 'hamming': np.hamming, 'blackman': np.blackman, 'rect': np.ones}
+            window = windows[window](self.nfft)
+        self.window = np.asarray(window, dtype=np.float64)
+        # amplitude of a sine wave from the magnitude of its bin
+        self.scale = 2.0 / self.window.sum()
+        self.freqs = np.fft.rfftfreq(self.nfft, d=1.0 / sample_rate)
+
+        # bins searched for each harmonic, as an (n_harmonics, 2 * search_bins + 1) index array
+        centers = np.round(np.arange(1, n_harmonics + 1) * fundamental * self.nfft / sample_rate).astype(int)
+        offsets = np.arange(-search_bins, search_bins + 1)
+        self._valid = centers + search_bins < len(self.freqs)
+        self._bins = np.clip(centers[:, None] + offsets[None, :], 0, len(self.freqs) - 1)
+
+        self._frames = np.empty((max_frames, self.nfft))
+        self._spectrum = np.empty((max_frames, len(self.freqs)), dtype=np.complex128)
+        self._amplitude = np.empty((max_frames, len(self.freqs)))
+        self._tail_times = np.array([], dtype=np.int64)
+        self._tail_values = np.array([], dtype=np.float64)
+
+    def update(self, times, values):
+        """
+        Adds a chunk of samples and returns the harmonics of every frame completed by it.
+
+        Parameters
+        ----------
+        times : numpy.array of int64
+            Timestamps of the samples in nanoseconds.
+        values : numpy.array of float64
+            Values of the samples.
+
+        Returns
+        ----------
+        frame_times : numpy.array of int64
+            Timestamp of the center of each frame in nanoseconds.
+        magnitudes : numpy.array of float64
+            (n_frames, n_harmonics) amplitudes of the fundamental (column 0) and its harmonics.
+        thd : numpy.array of float64
+            Total harmonic distortion of each frame, sqrt(sum of squared harmonics 2..N) / fundamental.
+        spectrum : numpy.array of float64
+            (n_frames, nfft // 2 + 1) amplitude spectrum of each frame, only if return_spectrum is True.
+            The frequency of each column is in the freqs attribute.
+        """
+        times = np.r_[self._tail_times, np.asarray(times, dtype=np.int64)]
+        values = np.r_[self._tail_values, np.asarray(values, dtype=np.float64)]
+        n_frames = 0 if len(values) < self.nfft else (len(values) - self.nfft) // self.hop + 1
+
+        frame_times = np.empty(n_frames, dtype=np.int64)
+        magnitudes = np.empty((n_frames, self.n_harmonics))
+        spectrum = np.empty((n_frames, len(self.freqs))) if self.return_spectrum else None
+        if n_frames > 0:
+            # strided view of every frame, no copy until the window is applied
+            frames = sliding_window_view(values, self.nfft)[::self.hop][:n_frames]
+            frame_times[:] = times[np.arange(n_frames) * self.hop + self.nfft // 2]
+            for first in range(0, n_frames, self.max_frames):
+                batch = frames[first:first + self.max_frames]
+                buffer = self._frames[:len(batch)]
+                np.multiply(batch, self.window, out=buffer)
+                transform = self._spectrum[:len(batch)]
+                if _RFFT_OUT:
+                    np.fft.rfft(buffer, axis=1, out=transform)
+                else:
+                    transform[:] = np.fft.rfft(buffer, axis=1)
+                amplitude = np.abs(transform, out=self._amplitude[:len(batch)])
+                amplitude *= self.scale
+                magnitudes[first:first + len(batch)] = amplitude[:, self._bins].max(axis=2)
+                if spectrum is not None:
+                    spectrum[first:first + len(batch)] = amplitude
+            magnitudes[:, ~self._valid] = np.nan
+
+        # keep the samples of the frames that are not complete yet
+        consumed = n_frames * self.hop
+        self._tail_times = times[consumed:]
+        self._tail_values = values[consumed:]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            thd = np.sqrt(np.nansum(np.square(magnitudes[:, 1:]), axis=1)) / magnitudes[:, 0]
+        if self.return_spectrum:
+            return frame_times, magnitudes, thd, spectrum
+        return frame_times, magnitudes, thd
+
+
+def iter_harmonics(stream, start, end, sample_rate, chunk_ns=60 * 10**9, version=0, prefetch=True, **kwargs):
+    """
+    Generator computing the harmonics of a point-on-wave stream over an arbitrarily long time range,
+    pulling the raw values chunk by chunk, so that memory stays bounded by the chunk size.
+    The next chunk is fetched in the background while the current one is transformed.
+
+    Parameters
+    ----------
+    stream : btrdb.Stream
+        Point-on-wave stream.
+    start : int, float or str
+        Start time in nanoseconds or as an ISO 8601 string.
+    end : int, float or str
+        End time in nanoseconds or as an ISO 8601 string.
+    sample_rate : int or float
+        Sample rate of the stream in hertz.
+    chunk_ns : int, default=60 * 10**9
+        Duration of the raw values fetched per query in nanoseconds.
+    version : int, default=0
+        Stream version.
+    prefetch : bool, default=True
+        Fetch the next chunk while the current chunk is being transformed.
+    kwargs :
+        Parameters of HarmonicAnalyzer (nfft, hop, fundamental, n_harmonics, window, ...).
+
+    Yields
+    ----------
+    The frame times, harmonic magnitudes and THD of each chunk, see HarmonicAnalyzer.update().
+
+    Examples
+    ----------
+    >>> for times, magnitudes, thd in iter_harmonics(stream, start, end, sample_rate=50000, fundamental=50):
+    ...     thd_trend.append(pd.Series(thd, index=pd.to_datetime(times)))
+    """
+    analyzer = HarmonicAnalyzer(sample_rate, **kwargs)
+    start, end = to_nanoseconds(start), to_nanoseconds(end)
+    boundaries = list(range(start, end, int(chunk_ns))) + [end]
+
+    def fetch(i):
+        return points_to_columns(stream.values(boundaries[i], boundaries[i + 1], version), ['value', 'time'])
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        pending = None
+        for i in range(len(boundaries) - 1):
+            times, values = pending.result() if pending is not None else fetch(i)
+            pending = executor.submit(fetch, i + 1) if executor is not None and i + 2 < len(boundaries) else None
+            result = analyzer.update(times, values[:, 0])
+            if len(result[0]) > 0:
+                yield result
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,147 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class MetadataCache(object):
+    """
+    Thread-safe cache of metadata lookups with a time to live, shared by get_streamset(), describe_streams()
+    and print_metadata_summary() so that repeated lookups for the same collection or stream are free.
+
+    Parameters
+    ----------
+    ttl : int or float, default=300
+        Number of seconds an entry stays valid.
+    maxsize : int, default=100000
+        Maximum number of entries. The least recently used entries are dropped first.
+
+    Examples
+    ----------
+    >>> metadata_cache = MetadataCache(ttl=600)
+    >>> streams = get_streamset(conn, 'POW/signatures', annotations={'type': 'fault'}, cache=metadata_cache)
+    >>> print(describe_streams(streams, cache=metadata_cache))
+    """
+    def __init__(self, ttl=300, maxsize=100000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # key -> (expiry time, value), ordered from least to most recently used
+        self._entries = OrderedDict()
+
+    def lookup(self, key):
+        """
+        Returns (True, value) if key is cached and has not expired, (False, None) otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key, value):
+        """
+        Stores value under key for ttl seconds.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, key, loader):
+        """
+        Returns the cached value of key, calling loader() and caching its result if key is missing or expired.
+        """
+        found, value = self.lookup(key)
+        if not found:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """
+        Drops key from the cache, or every entry if key is None.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+def collection_annotation_keys(conn, collections, cache=None):
+    """
+    Returns the annotation keys used by the streams of each collection with a single metadata query.
+    As with conn.collection_metadata(), a collection matches every collection name starting with it.
+
+    Parameters
+    ----------
+    conn : BTrDB connection object
+    collections : list of str
+        Collection names or prefixes.
+    cache : MetadataCache, default=None
+        Cache of the keys found for each collection. Only the collections not cached are queried.
+
+    Returns
+    ----------
+    keys : dict
+        Maps each collection to the set of annotation keys of its streams.
+    """
+    keys = {}
+    missing = []
+    for collection in collections:
+        found, value = cache.lookup(('annotation_keys', collection)) if cache is not None else (False, None)
+        if found:
+            keys[collection] = value
+        else:
+            missing.append(collection)
+
+    if len(missing) > 0:
+        sql = "select distinct collection, skeys(annotations) as key from streams where collection similar to $1"
+        rows = conn.query(sql, ['|'.join([f"{c}%" for c in missing])])
+        for collection in missing:
+            keys[collection] = {row['key'] for row in rows if row['collection'].startswith(collection)}
+            if cache is not None:
+                cache.set(('annotation_keys', collection), keys[collection])
+    return keys
+
+
+def streams_metadata(conn, uuids, cache=None):
+    """
+    Returns the metadata rows (tags, annotations and property version) of many streams with a single query.
+
+    Parameters
+    ----------
+    conn : BTrDB connection object
+    uuids : list of str or uuid.UUID
+        UUIDs of the streams.
+    cache : MetadataCache, default=None
+        Cache of the metadata of each stream. Only the streams not cached are queried.
+
+    Returns
+    ----------
+    metadata : dict
+        Maps the str of each uuid to its row of the streams table.
+    """
+    metadata = {}
+    missing = []
+    for uuid in map(str, uuids):
+        found, value = cache.lookup(('metadata', uuid)) if cache is not None else (False, None)
+        if found:
+            metadata[uuid] = value
+        else:
+            missing.append(uuid)
+
+    if len(missing) > 0:
+        placeholders = ','.join(f"${i + 1}" for i in range(len(missing)))
+        rows = conn.query(f"select * from streams where uuid in ({placeholders})", missing)
+        for row in rows:
+            uuid = str(row['uuid'])
+            metadata[uuid] = row
+            if cache is not None:
+                cache.set(('metadata', uuid), row)
+    return metadata
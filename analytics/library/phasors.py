@@ -0,0 +1,205 @@
+import numpy as np
+
+
+# Fortescue operator a = 1 /_ 120 degrees
+A = np.exp(2j * np.pi / 3)
+# maps phase phasors [Va, Vb, Vc] to sequence components [V0, V1, V2]
+SEQUENCE_MATRIX = np.array([[1, 1, 1],
+                            [1, A, A**2],
+                            [1, A**2, A]]) / 3
+# maps sequence components [V0, V1, V2] back to phase phasors [Va, Vb, Vc]
+PHASE_MATRIX = np.array([[1, 1, 1],
+                         [1, A**2, A],
+                         [1, A, A**2]])
+
+
+def _phase_axis(array, n_phases=3):
+    """
+    Helper function that views a (n_samples, n_pmus * 3) array as (n_samples, n_pmus, 3) without copying.
+    """
+    array = np.asarray(array)
+    if array.shape[-1] != n_phases:
+        array = array.reshape(array.shape[:-1] + (-1, n_phases))
+    return array
+
+
+def to_phasors(mag, ang, deg=True, out=None):
+    """
+    Builds complex phasors from magnitude and angle arrays of any shape, e.g. an aligned
+    (n_samples, n_streams) array of a whole PMU or of many PMUs.
+
+    Parameters
+    ----------
+    mag : numpy.array
+        Magnitudes.
+    ang : numpy.array
+        Angles, with the same shape as mag. Angles do not need to be unwrapped.
+    deg : bool, default=True
+        Angles are in degrees if True, in radians otherwise.
+    out : numpy.array of complex128, default=None
+        Preallocated output array with the shape of mag, reused across chunks to avoid allocations.
+
+    Returns
+    ----------
+    phasors : numpy.array of complex128
+        mag * exp(1j * ang).
+
+    Examples
+    ----------
+    >>> V = to_phasors(df[['L1MAG', 'L2MAG', 'L3MAG']].values, df[['L1ANG', 'L2ANG', 'L3ANG']].values)
+    """
+    mag = np.asarray(mag, dtype=np.float64)
+    rad = np.deg2rad(ang) if deg else np.asarray(ang, dtype=np.float64)
+    if out is None:
+        out = np.empty(mag.shape, dtype=np.complex128)
+    np.cos(rad, out=out.real)
+    np.sin(rad, out=out.imag)
+    out.real *= mag
+    out.imag *= mag
+    return out
+
+
+def sequence_components(phasors, out=None):
+    """
+    Computes the zero, positive and negative sequence components of three phase phasors,
+    for every sample and every PMU in a single matrix product.
+
+    Parameters
+    ----------
+    phasors : numpy.array of complex128
+        (..., 3) phasors of phases A, B and C, or (n_samples, n_pmus * 3) with the phases of each PMU side by side.
+    out : numpy.array of complex128, default=None
+        Preallocated (..., 3) output array, reused across chunks to avoid allocations.
+
+    Returns
+    ----------
+    components : numpy.array of complex128
+        (..., 3) array of [V0, V1, V2].
+
+    Examples
+    ----------
+    >>> V012 = sequence_components(to_phasors(mags, angs))
+    >>> V1 = V012[..., 1]
+    """
+    phasors = _phase_axis(phasors)
+    return np.matmul(phasors, SEQUENCE_MATRIX.T, out=out)
+
+
+def phase_components(components, out=None):
+    """
+    Inverse of sequence_components(): rebuilds the phase phasors [Va, Vb, Vc] from [V0, V1, V2].
+    """
+    return np.matmul(_phase_axis(components), PHASE_MATRIX.T, out=out)
+
+
+def unbalance_factors(components):
+    """
+    Computes the voltage (or current) unbalance factors from sequence components.
+
+    Parameters
+    ----------
+    components : numpy.array of complex128
+        (..., 3) array of [V0, V1, V2], as returned by sequence_components().
+
+    Returns
+    ----------
+    negative : numpy.array of float64
+        Negative sequence unbalance factor |V2| / |V1|.
+    zero : numpy.array of float64
+        Zero sequence unbalance factor |V0| / |V1|.
+    """
+    magnitudes = np.abs(components)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return magnitudes[..., 2] / magnitudes[..., 1], magnitudes[..., 0] / magnitudes[..., 1]
+
+
+def complex_power(voltages, currents, total=False, out=None):
+    """
+    Computes the complex power S = V * conj(I) of every phase, from RMS voltage and current phasors.
+    P, Q and |S| are the real part, the imaginary part and the absolute value of the result.
+
+    Parameters
+    ----------
+    voltages : numpy.array of complex128
+        Voltage phasors, e.g. (n_samples, n_pmus * 3).
+    currents : numpy.array of complex128
+        Current phasors, with the same shape as voltages.
+    total : bool, default=False
+        Sum the power of the three phases of each PMU, giving a (n_samples, n_pmus) array.
+    out : numpy.array of complex128, default=None
+        Preallocated output array with the shape of voltages, reused across chunks to avoid allocations.
+
+    Returns
+    ----------
+    power : numpy.array of complex128
+        Complex power per phase, or per PMU if total is True.
+
+    Examples
+    ----------
+    >>> S = complex_power(to_phasors(v_mag, v_ang), to_phasors(i_mag, i_ang))
+    >>> P, Q = S.real, S.imag
+    """
+    out = np.conjugate(currents, out=out)
+    out *= voltages
+    if total:
+        return _phase_axis(out).sum(axis=-1)
+    return out
+
+
+class PhasorCalculator(object):
+    """
+    Computes phasors, sequence components, unbalance factors and complex power for chunks of aligned
+    magnitude/angle arrays of one or many three phase PMUs, reusing its output buffers from chunk to chunk.
+    The columns of each input are the phases A, B and C of each PMU side by side, (n_samples, n_pmus * 3).
+
+    Parameters
+    ----------
+    deg : bool, default=True
+        Angles are in degrees if True, in radians otherwise.
+
+    Examples
+    ----------
+    >>> calculator = PhasorCalculator()
+    >>> for times, values, columns in iter_streams_chunks(streams, start, end, chunk_ns=ns_delta(hours=1), as_array=True):
+    ...     results = calculator.update(values[:, v_mag], values[:, v_ang], values[:, i_mag], values[:, i_ang])
+    ...     unbalance = results['negative_unbalance']
+    """
+    def __init__(self, deg=True):
+        self.deg = deg
+        self._buffers = {}
+
+    def _buffer(self, name, shape):
+        # reuse the buffer of the previous chunk when it is large enough
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape[0] < shape[0] or buffer.shape[1:] != shape[1:]:
+            buffer = np.empty(shape, dtype=np.complex128)
+            self._buffers[name] = buffer
+        return buffer[:shape[0]]
+
+    def update(self, v_mag, v_ang, i_mag=None, i_ang=None):
+        """
+        Processes a chunk of samples.
+
+        Returns
+        ----------
+        results : dict
+            'V' phase voltage phasors, 'V012' voltage sequence components (n_samples, n_pmus, 3),
+            'negative_unbalance' and 'zero_unbalance' factors (n_samples, n_pmus), and if currents are given,
+            'I', 'I012', 'S' per phase complex power and 'S_total' per PMU complex power.
+            The arrays are views of buffers reused by the next call; copy them to keep them.
+        """
+        v_mag = np.asarray(v_mag, dtype=np.float64)
+        results = {}
+        results['V'] = to_phasors(v_mag, v_ang, deg=self.deg, out=self._buffer('V', v_mag.shape))
+        v = _phase_axis(results['V'])
+        results['V012'] = sequence_components(v, out=self._buffer('V012', v.shape))
+        results['negative_unbalance'], results['zero_unbalance'] = unbalance_factors(results['V012'])
+
+        if i_mag is not None:
+            i_mag = np.asarray(i_mag, dtype=np.float64)
+            results['I'] = to_phasors(i_mag, i_ang, deg=self.deg, out=self._buffer('I', i_mag.shape))
+            i = _phase_axis(results['I'])
+            results['I012'] = sequence_components(i, out=self._buffer('I012', i.shape))
+            results['S'] = complex_power(results['V'], results['I'], out=self._buffer('S', v_mag.shape))
+            results['S_total'] = _phase_axis(results['S']).sum(axis=-1)
+        return results
@@ -0,0 +1,129 @@
+import re
+
+import btrdb
+import numpy as np
+from btrdb.utils.timez import to_nanoseconds
+
+
+# bytes of one float64 column or int64 timestamp in the result
+VALUE_BYTES = 8
+STAT_AGG = ['min', 'mean', 'max', 'count', 'stddev']
+
+
+def stream_sample_rate(stream, cache=None):
+    """
+    Returns the sample rate of a stream in hertz from its 'sample_rate' annotation, or None if it is unknown.
+    Annotations such as '30', '30.0' or '30 Hz' are accepted.
+
+    Parameters
+    ----------
+    stream : btrdb.Stream
+        Stream object.
+    cache : library.metadata.MetadataCache, default=None
+        Cache of the sample rate of each stream.
+    """
+    def load():
+        annotations, _ = stream.annotations()
+        match = re.search(r'[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?', str(annotations.get('sample_rate', '')))
+        return float(match.group()) if match is not None and float(match.group()) > 0 else None
+
+    if cache is None:
+        return load()
+    return cache.get(('sample_rate', str(stream.uuid)), load)
+
+
+def count_aligned_windows(start, end, pw):
+    """
+    Returns the number of windows returned by aligned_windows(start, end, pw) over data without gaps.
+    """
+    width = 1 << int(pw)
+    return max(-(-int(end) // width) - int(start) // width, 0)
+
+
+def plan_query(streams, start, end, max_points=None, max_bytes=None, agg=None, aligned=True,
+               sample_rate=None, cache=None):
+    """
+    Picks the query resolution of streams_to_df() that returns the most detail within a budget of points per stream
+    or of memory, whatever the length of the time range. Raw values are chosen when the known sample rate
+    of the streams (their 'sample_rate' annotation) fits them in the budget, since they are exact and need
+    no aggregation. Otherwise the finest pointwidth (or window width) that fits is chosen.
+
+    Parameters
+    ----------
+    streams : btrdb.Stream, [btrdb.Stream], or btrdb.Stream.Streamset
+        Streams to query.
+    start : int, float or str
+        Start time in nanoseconds or as an ISO 8601 string.
+    end : int, float or str
+        End time in nanoseconds or as an ISO 8601 string.
+    max_points : int, default=None
+        Maximum number of points per stream, e.g. the width of a plot in pixels.
+    max_bytes : int, default=None
+        Maximum size in bytes of the result of all the streams. At least one of max_points and max_bytes is required.
+    agg : [str], default=None
+        Aggregates kept from the stat points, see streams_to_df(). Defaults to all of them.
+    aligned : bool, default=True
+        Use aligned_windows() (a power of 2 window) if True, windows() (any window width) otherwise.
+    sample_rate : int or float, default=None
+        Sample rate of the streams in hertz. Defaults to the highest sample_rate annotation of the streams.
+        Raw values are never chosen if it is unknown.
+    cache : library.metadata.MetadataCache, default=None
+        Cache of the sample rates of the streams.
+
+    Returns
+    ----------
+    plan : dict
+        'pw', 'width' and 'depth' to pass to streams_to_df() (all None for raw values),
+        'points' estimated number of points per stream and 'bytes' estimated size of the result.
+
+    Examples
+    ----------
+    >>> plan = plan_query(streams, start, end, max_points=2000)
+    >>> df = streams_to_df(streams, start, end, pw=plan['pw'], width=plan['width'], depth=plan['depth'])
+    # or, equivalently
+    >>> df = streams_to_df(streams, start, end, max_points=2000)
+    """
+    if max_points is None and max_bytes is None:
+        raise ValueError('max_points or max_bytes must be specified.')
+    if isinstance(streams, btrdb.stream.Stream):
+        streams = [streams]
+    streams = list(streams)
+    start, end = to_nanoseconds(start), to_nanoseconds(end)
+    duration = end - start
+    if duration <= 0:
+        raise ValueError('end must be after start.')
+    n_streams = max(len(streams), 1)
+    n_agg = len([a for a in (agg or STAT_AGG) if a != 'time'])
+
+    def budget(columns):
+        # points per stream that fit both budgets, each row holding a timestamp and the columns of every stream
+        points = np.inf if max_points is None else max_points
+        if max_bytes is not None:
+            points = min(points, max_bytes // (VALUE_BYTES * (1 + n_streams * columns)))
+        return int(points)
+
+    def plan(pw=None, width=None, depth=None, points=0, columns=1):
+        return {'pw': pw, 'width': width, 'depth': depth, 'points': int(points),
+                'bytes': int(points * VALUE_BYTES * (1 + n_streams * columns))}
+
+    if sample_rate is None:
+        rates = [stream_sample_rate(stream, cache=cache) for stream in streams]
+        sample_rate = None if len(rates) == 0 or None in rates else max(rates)
+    if sample_rate is not None:
+        raw_points = int(np.ceil(duration * sample_rate / 1e9))
+        if raw_points <= budget(1):
+            return plan(points=raw_points)
+
+    max_windows = budget(n_agg)
+    if max_windows < 1:
+        raise ValueError('the budget is too small for a single point per stream.')
+    if aligned:
+        pw = max(int(np.ceil(np.log2(duration / max_windows))), 0)
+        while pw < 62 and count_aligned_windows(start, end, pw) > max_windows:
+            pw += 1
+        return plan(pw=pw, points=count_aligned_windows(start, end, pw), columns=n_agg)
+
+    width = int(np.ceil(duration / max_windows))
+    # windows accurate to about 1/256 of their width, much faster than exact windows (depth=0)
+    depth = max(int(np.log2(width)) - 8, 0)
+    return plan(width=width, depth=depth, points=duration // width, columns=n_agg)
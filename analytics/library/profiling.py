@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+
+import btrdb
+import pandas as pd
+from tabulate import tabulate
+
+
+STREAM_METHODS = ('values', 'aligned_windows', 'windows', 'earliest', 'latest', 'nearest', 'count', 'version',
+                  'insert', 'delete')
+CONNECTION_METHODS = ('query', 'streams', 'stream_from_uuid', 'streams_in_collection', 'collection_metadata',
+                      'list_collections')
+# estimated bytes transferred per point: time and value for raw points, time and 5 statistics for stat points
+POINT_BYTES = {'values': 16, 'insert': 16, 'earliest': 16, 'latest': 16, 'nearest': 16,
+               'aligned_windows': 48, 'windows': 48}
+
+_active = []
+_lock = threading.Lock()
+_originals = {}
+_local = threading.local()
+
+
+class Profiler(object):
+    """
+    Records the BTrDB calls and the local phases of the library while it is active, see profile().
+
+    Attributes
+    ----------
+    records : list of dict
+        One record per call or phase, with its 'kind' ('call' or 'phase'), 'name', 'start' and 'duration'
+        in seconds, 'thread', 'points', 'bytes' and 'params'.
+    wall : float
+        Wall time of the profiled block in seconds.
+    """
+    def __init__(self):
+        self.records = []
+        self.wall = None
+        self._start = None
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def to_dataframe(self):
+        """
+        Returns the records as a dataframe, with start times relative to the start of the profiled block.
+        """
+        df = pd.DataFrame(self.records, columns=['kind', 'name', 'start', 'duration', 'thread', 'points', 'bytes',
+                                                 'params', 'error'])
+        df['start'] -= self._start
+        return df
+
+    def summary(self):
+        """
+        Returns the number of calls, total, mean and max duration in seconds, points and estimated bytes
+        of every BTrDB method and local phase, sorted by total duration.
+        Durations of concurrent calls add up, so totals can exceed the wall time.
+        """
+        df = self.to_dataframe()
+        summary = df.groupby(['kind', 'name']).agg(calls=('duration', 'size'), total=('duration', 'sum'),
+                                                    mean=('duration', 'mean'), max=('duration', 'max'),
+                                                    points=('points', 'sum'), bytes=('bytes', 'sum'))
+        return summary.sort_values('total', ascending=False)
+
+    def __str__(self):
+        summary = self.summary().reset_index()
+        wall = f'wall time {self.wall:.3f} s' if self.wall is not None else 'running'
+        return f'{wall}, {len(self.records)} records\n' + tabulate(summary, headers='keys', showindex=False,
+                                                                     floatfmt='.4f')
+
+    def export(self, path):
+        """
+        Writes the records as a Chrome trace file (trace event format), which can be opened in chrome://tracing
+        or https://ui.perfetto.dev to see the calls of every thread on a timeline.
+        """
+        events = []
+        for record in self.records:
+            events.append({'name': record['name'], 'cat': record['kind'], 'ph': 'X', 'pid': os.getpid(),
+                           'tid': record['thread'], 'ts': (record['start'] - self._start) * 1e6,
+                           'dur': record['duration'] * 1e6,
+                           'args': {'points': record['points'], 'bytes': record['bytes'], **record['params'],
+                                    **({'error': record['error']} if record['error'] else {})}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+def _record(kind, name, start, duration, points=0, nbytes=0, params=None, error=None):
+    """
+    Helper function that adds a record to every active profiler.
+    """
+    record = {'kind': kind, 'name': name, 'start': start, 'duration': duration, 'thread': threading.get_ident(),
+              'points': points, 'bytes': nbytes, 'params': params or {}, 'error': error}
+    for profiler in list(_active):
+        profiler.add(record)
+
+
+def _simple(value):
+    """
+    Helper function that converts a parameter to a value that can be written in a trace.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)) and len(value) > 8:
+        return f'<{len(value)} items>'
+    return str(value)
+
+
+def _describe_call(func, name, self, args, kwargs, result):
+    """
+    Helper function that returns the points, estimated bytes and parameters of a BTrDB call.
+    """
+    try:
+        arguments = inspect.signature(func).bind(self, *args, **kwargs).arguments
+    except TypeError:
+        arguments = dict(enumerate(args), **kwargs)
+    params = {str(k): _simple(v) for k, v in arguments.items() if k != 'self'}
+    if isinstance(self, btrdb.stream.Stream):
+        params['uuid'] = str(self._uuid)
+
+    if name == 'insert':
+        points = len(args[0]) if len(args) > 0 else len(kwargs.get('data', []))
+        params.pop('data', None)
+    elif result is None:
+        points = 0
+    elif name in ('earliest', 'latest', 'nearest'):
+        points = 1
+    elif isinstance(result, (list, tuple)) or name == 'streams':
+        points = len(result)
+    else:
+        points = 0
+    if name == 'query' and result is not None:
+        nbytes = sum(len(str(row)) for row in result)
+    else:
+        nbytes = points * POINT_BYTES.get(name, 0)
+    return points, nbytes, params
+
+
+def _instrument(func, name):
+    """
+    Helper function that wraps a BTrDB method so that it is recorded while a profiler is active.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        # calls made inside another recorded call (e.g. by the btrdb client itself) are part of it
+        if len(_active) == 0 or getattr(_local, 'depth', 0) > 0:
+            return func(self, *args, **kwargs)
+        _local.depth = 1
+        start = time.perf_counter()
+        result = None
+        error = None
+        try:
+            result = func(self, *args, **kwargs)
+            return result
+        except Exception as err:
+            error = repr(err)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _local.depth = 0
+            points, nbytes, params = _describe_call(func, name, self, args, kwargs, result)
+            _record('call', name, start, duration, points, nbytes, params, error)
+    wrapper._profiled = True
+    return wrapper
+
+
+def _classes(base):
+    """
+    Helper function that returns a class and all its subclasses.
+    """
+    classes = [base]
+    for subclass in base.__subclasses__():
+        classes.extend(_classes(subclass))
+    return classes
+
+
+def _install():
+    """
+    Helper function that wraps the methods of btrdb.stream.Stream, btrdb.conn.BTrDB and all their subclasses.
+    """
+    for base, methods in ((btrdb.stream.Stream, STREAM_METHODS), (btrdb.conn.BTrDB, CONNECTION_METHODS)):
+        for cls in _classes(base):
+            for name in methods:
+                func = cls.__dict__.get(name)
+                if func is None or getattr(func, '_profiled', False):
+                    continue
+                _originals[(cls, name)] = func
+                setattr(cls, name, _instrument(func, name))
+
+
+def _uninstall():
+    """
+    Helper function that restores the original methods.
+    """
+    for (cls, name), func in _originals.items():
+        setattr(cls, name, func)
+    _originals.clear()
+
+
+class phase(object):
+    """
+    Context manager timing a local step of the library (e.g. 'convert', 'align', 'to_datetime') while a profiler
+    is active. It costs a single list check otherwise.
+
+    Examples
+    ----------
+    >>> with phase('convert'):
+    ...     times, values = points_to_columns(data, agg)
+    """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if len(_active) > 0:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None and len(_active) > 0:
+            _record('phase', self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+@contextmanager
+def profile(trace=None):
+    """
+    Context manager recording every BTrDB call made inside it (by the library or not), with its wall time,
+    number of points, estimated bytes and parameters, and the time spent in the local phases of the library:
+    'convert' (points to NumPy columns), 'align' (merging the streams on a shared time vector),
+    'dataframe' (building the dataframe) and 'to_datetime'. Nothing is recorded and no method is wrapped outside of it.
+
+    Parameters
+    ----------
+    trace : str, default=None
+        Path of a Chrome trace file written when the block exits, see Profiler.export().
+
+    Yields
+    ----------
+    profiler : Profiler
+        Records of the block. Print it for a summary table, or call summary() for a dataframe.
+
+    Examples
+    ----------
+    >>> with profile(trace='streams_to_df.json') as report:
+    ...     df = streams_to_df(streams, start, end, pw=30, max_workers=8)
+    >>> print(report)
+    >>> report.summary().loc['call', 'aligned_windows']
+    """
+    profiler = Profiler()
+    with _lock:
+        if len(_active) == 0:
+            _install()
+        _active.append(profiler)
+    profiler._start = time.perf_counter()
+    try:
+        yield profiler
+    finally:
+        profiler.wall = time.perf_counter() - profiler._start
+        with _lock:
+            _active.remove(profiler)
+            if len(_active) == 0:
+                _uninstall()
+        if trace is not None:
+            profiler.export(trace)
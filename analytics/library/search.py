@@ -0,0 +1,304 @@
+import heapq
+import itertools
+import btrdb
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from btrdb.utils.timez import to_nanoseconds
+
+from .utils import points_to_columns
+
+
+def coalesce_windows(starts, width, max_gap=0):
+    """
+    Merges sorted, equally sized windows into contiguous time ranges so that adjacent windows
+    can be fetched with a single query.
+
+    Parameters
+    ----------
+    starts : numpy.array of int64
+        Sorted start times of the windows in nanoseconds.
+    width : int
+        Width of every window in nanoseconds.
+    max_gap : int, default=0
+        Windows separated by at most this many nanoseconds are also merged, gap included,
+        trading a little extra data for fewer queries.
+
+    Returns
+    ----------
+    ranges : list of (int, int)
+        Start and end time of each contiguous range.
+    """
+    if len(starts) == 0:
+        return []
+    breaks = np.nonzero(np.diff(starts) > width + max_gap)[0] + 1
+    range_starts = starts[np.r_[0, breaks]]
+    range_ends = starts[np.r_[breaks - 1, len(starts) - 1]] + width
+    return list(zip(range_starts.tolist(), range_ends.tolist()))
+
+
+def _fetch_ranges(executor, tasks, query):
+    """
+    Helper function that runs query(stream_index, start, end) for every task on the thread pool
+    and returns the results grouped by stream index, in task order.
+    """
+    results = {}
+    for (ith_stream, _, _), result in zip(tasks, executor.map(lambda t: query(*t), tasks)):
+        results.setdefault(ith_stream, []).append(result)
+    return results
+
+
+def iter_threshold_batches(streams, threshold, start=btrdb.MINIMUM_TIME, end=btrdb.MAXIMUM_TIME,
+                           pw=48, below=True, raw_pw=30, step=4, group_size=64, version=0, max_workers=8):
+    """
+    Finds all the raw points below (or above) a threshold in many streams with a breadth first search
+    of the stat point tree. At each level, the candidate windows of all the streams are coalesced into
+    contiguous ranges and their children are fetched concurrently, descending `step` pointwidths per round.
+
+    Parameters
+    ----------
+    streams : btrdb.Stream, [btrdb.Stream], or btrdb.Stream.Streamset
+        Streams to search.
+    threshold : int, float or list of int or float
+        Threshold, either shared by all the streams or one per stream.
+    start : int, float or str, default=btrdb.MINIMUM_TIME
+        Time to start searching in nanoseconds or as an ISO 8601 string.
+    end : int, float or str, default=btrdb.MAXIMUM_TIME
+        Time to stop searching in nanoseconds or as an ISO 8601 string.
+    pw : int, default=48
+        Pointwidth of the top level of the search.
+    below : bool, default=True
+        Find points with values below or equal to the threshold if True, above or equal to the threshold otherwise.
+    raw_pw : int, default=30
+        Pointwidth of the windows for which the raw values are queried.
+    step : int, default=4
+        Number of pointwidths descended per round. Each candidate window is split into 2**step children.
+    group_size : int, default=64
+        Number of consecutive top level windows searched together. Bounds the memory used by the search.
+    version : int, default=0
+        Stream version.
+    max_workers : int, default=8
+        Maximum number of queries running at the same time.
+
+    Yields
+    ----------
+    stream_indices : numpy.array of int
+        Index of the stream of each point found.
+    times : numpy.array of int64
+        Timestamps of the points found in nanoseconds.
+    values : numpy.array of float64
+        Values of the points found.
+    Batches are yielded in time order, and the points within a batch are sorted by time.
+
+    Examples
+    ----------
+    >>> vnoms = [get_global_mean_value(s) for s in streams]
+    >>> for idx, times, values in iter_threshold_batches(streams, 0.9 * np.array(vnoms), start, end):
+    ...     print(len(times), 'sag points found')
+    """
+    if isinstance(streams, btrdb.stream.Stream):
+        streams = [streams]
+    streams = list(streams)
+    if pw <= raw_pw:
+        raise ValueError('pw must be larger than raw_pw.')
+    if step < 1:
+        raise ValueError('step must be a positive integer.')
+
+    start, end = to_nanoseconds(start), to_nanoseconds(end)
+    threshold = np.broadcast_to(np.asarray(threshold, dtype=np.float64), (len(streams),))
+    agg = ['min'] if below else ['max']
+
+    def is_candidate(ith_stream, values):
+        return values <= threshold[ith_stream] if below else values >= threshold[ith_stream]
+
+    def windows_query(level):
+        def query(ith_stream, wstart, wend):
+            times, values = points_to_columns(streams[ith_stream].aligned_windows(wstart, wend, level, version),
+                                              agg + ['time'])
+            return times[is_candidate(ith_stream, values[:, 0])]
+        return query
+
+    def values_query(ith_stream, wstart, wend):
+        times, values = points_to_columns(streams[ith_stream].values(wstart, wend, version), ['value', 'time'])
+        mask = is_candidate(ith_stream, values[:, 0]) & (times >= start) & (times < end)
+        return times[mask], values[mask, 0]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # candidate windows at the top level, one query per stream
+        tasks = [(ith_stream, start, end) for ith_stream in range(len(streams))]
+        top = _fetch_ranges(executor, tasks, windows_query(pw))
+        top = {ith_stream: np.concatenate(starts) for ith_stream, starts in top.items()}
+
+        window_times = np.unique(np.concatenate(list(top.values()))) if top else np.array([], dtype=np.int64)
+        for group in range(0, len(window_times), group_size):
+            group_times = window_times[group:group + group_size]
+            frontier = {ith_stream: starts[np.isin(starts, group_times)] for ith_stream, starts in top.items()}
+
+            level = pw
+            while level > raw_pw:
+                child = max(level - step, raw_pw)
+                tasks = [(ith_stream, s, e) for ith_stream, starts in frontier.items()
+                         for s, e in coalesce_windows(starts, 2 ** level)]
+                children = _fetch_ranges(executor, tasks, windows_query(child))
+                frontier = {ith_stream: np.concatenate(starts) for ith_stream, starts in children.items()}
+                level = child
+
+            tasks = [(ith_stream, s, e) for ith_stream, starts in sorted(frontier.items())
+                     for s, e in coalesce_windows(starts, 2 ** level)]
+            if len(tasks) == 0:
+                continue
+            results = executor.map(lambda t: values_query(*t), tasks)
+            indices, times, values = [], [], []
+            for (ith_stream, _, _), (t, v) in zip(tasks, results):
+                indices.append(np.full(len(t), ith_stream))
+                times.append(t)
+                values.append(v)
+            times = np.concatenate(times)
+            if len(times) == 0:
+                continue
+            order = np.argsort(times, kind='stable')
+            yield np.concatenate(indices)[order], times[order], np.concatenate(values)[order]
+
+
+def find_threshold_points(streams, threshold, start=btrdb.MINIMUM_TIME, end=btrdb.MAXIMUM_TIME,
+                          pw=48, below=True, raw_pw=30, step=4, group_size=64, version=0, max_workers=8):
+    """
+    Generator yielding the raw points below (or above) a threshold in many streams, in time order.
+    Level batched replacement of the depth first find_sags_dfs() search; see iter_threshold_batches() for the parameters.
+
+    Yields
+    ----------
+    stream : btrdb.Stream
+        Stream in which the point was found.
+    time : int
+        Timestamp of the point in nanoseconds.
+    value : float
+        Value of the point.
+
+    Examples
+    ----------
+    >>> vnom = get_global_mean_value(stream)
+    >>> sags = find_threshold_points(stream, 0.9 * vnom, start=start, end=end)
+    >>> stream, time, value = next(sags)
+    """
+    if isinstance(streams, btrdb.stream.Stream):
+        streams = [streams]
+    streams = list(streams)
+    for indices, times, values in iter_threshold_batches(streams, threshold, start=start, end=end, pw=pw,
+                                                         below=below, raw_pw=raw_pw, step=step,
+                                                         group_size=group_size, version=version,
+                                                         max_workers=max_workers):
+        for ith_stream, time, value in zip(indices.tolist(), times.tolist(), values.tolist()):
+            yield streams[ith_stream], time, value
+
+
+def find_extremes(streams, k=10, start=btrdb.MINIMUM_TIME, end=btrdb.MAXIMUM_TIME, largest=True,
+                  pw=50, raw_pw=30, window_pw=None, step=4, batch_size=8, version=0, max_workers=8):
+    """
+    Finds the k largest (or smallest) raw points, or stat point windows, across many streams with a best first
+    search of the stat point tree. Windows are expanded in order of their max (or min), so only the windows that
+    may contain one of the k extremes are ever queried, and windows that cannot beat the current k-th value are pruned.
+
+    Parameters
+    ----------
+    streams : btrdb.Stream, [btrdb.Stream], or btrdb.Stream.Streamset
+        Streams to search.
+    k : int, default=10
+        Number of extremes to return.
+    start : int, float or str, default=btrdb.MINIMUM_TIME
+        Time to start searching in nanoseconds or as an ISO 8601 string.
+    end : int, float or str, default=btrdb.MAXIMUM_TIME
+        Time to stop searching in nanoseconds or as an ISO 8601 string.
+    largest : bool, default=True
+        Find the largest values if True, the smallest values otherwise.
+    pw : int, default=50
+        Pointwidth of the top level of the search.
+    raw_pw : int, default=30
+        Pointwidth of the windows for which the raw values are queried.
+    window_pw : int, default=None
+        If specified, return the k extreme windows of this pointwidth instead of raw points.
+        Windows at the edges of the range may extend beyond it.
+    step : int, default=4
+        Number of pointwidths descended each time a window is expanded.
+    batch_size : int, default=8
+        Number of the most promising windows expanded concurrently.
+    version : int, default=0
+        Stream version.
+    max_workers : int, default=8
+        Maximum number of queries running at the same time.
+
+    Returns
+    ----------
+    extremes : list of (btrdb.Stream, int, float)
+        Stream, timestamp in nanoseconds (window start when window_pw is specified) and value (window max or min)
+        of the k extremes, from most to least extreme.
+
+    Examples
+    ----------
+    >>> streams = db.streams_in_collection('sunshine', tags={'unit': 'amps'})
+    >>> for stream, time, value in find_extremes(streams, k=100):
+    ...     print(stream.name, ns_to_datetime(time), value)
+    """
+    if isinstance(streams, btrdb.stream.Stream):
+        streams = [streams]
+    streams = list(streams)
+    leaf_pw = raw_pw if window_pw is None else window_pw
+    if pw <= leaf_pw:
+        raise ValueError('pw must be larger than the pointwidth of the leaves.')
+
+    start, end = to_nanoseconds(start), to_nanoseconds(end)
+    sign = 1.0 if largest else -1.0
+    agg = ['max'] if largest else ['min']
+
+    # candidates is a heap of (-score, tie breaker, stream index, time, pointwidth); pointwidth is None for raw points
+    candidates = []
+    # scores of the k best leaves pushed so far, the smallest first; anything below found[0] is pruned
+    found = []
+    counter = itertools.count()
+
+    def push(ith_stream, times, values, level):
+        scores = sign * values
+        is_leaf = level is None or level == window_pw
+        for time, score in zip(times.tolist(), scores.tolist()):
+            if len(found) == k and score < found[0]:
+                continue
+            heapq.heappush(candidates, (-score, next(counter), ith_stream, time, level))
+            if is_leaf:
+                if len(found) < k:
+                    heapq.heappush(found, score)
+                else:
+                    heapq.heappushpop(found, score)
+
+    def expand(ith_stream, time, level):
+        stream = streams[ith_stream]
+        if level <= raw_pw and window_pw is None:
+            times, values = points_to_columns(stream.values(time, time + 2 ** level, version), ['value', 'time'])
+            mask = (times >= start) & (times < end)
+            return ith_stream, times[mask], values[mask, 0], None
+        child = max(level - step, leaf_pw)
+        times, values = points_to_columns(stream.aligned_windows(time, time + 2 ** level, child, version),
+                                          agg + ['time'])
+        # a parent window at the edge of the range has children entirely outside of it
+        mask = (times < end) & (times + 2 ** child > start)
+        return ith_stream, times[mask], values[mask, 0], child
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        top = executor.map(lambda i: points_to_columns(streams[i].aligned_windows(start, end, pw, version),
+                                                       agg + ['time']), range(len(streams)))
+        for ith_stream, (times, values) in enumerate(top):
+            push(ith_stream, times, values[:, 0], pw)
+
+        extremes = []
+        while len(extremes) < k and len(candidates) > 0:
+            # a leaf at the top of the heap is better than anything left to expand
+            while len(candidates) > 0 and len(extremes) < k and candidates[0][4] in (None, window_pw):
+                score, _, ith_stream, time, _ = heapq.heappop(candidates)
+                extremes.append((streams[ith_stream], time, -score * sign))
+            batch = []
+            while len(candidates) > 0 and len(batch) < batch_size and candidates[0][4] not in (None, window_pw):
+                score, _, ith_stream, time, level = heapq.heappop(candidates)
+                if len(found) == k and -score < found[0]:
+                    continue
+                batch.append((ith_stream, time, level))
+            for ith_stream, times, values, level in executor.map(lambda w: expand(*w), batch):
+                push(ith_stream, times, values, level)
+    return extremes
@@ -3,31 +3,89 @@ import numpy as np
 import pandas as pd
 from tabulate import tabulate
 from tqdm.auto import tqdm 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import attrgetter, itemgetter
 from btrdb.utils.general import pointwidth
 from btrdb.utils.timez import ns_delta
 
+from .metadata import collection_annotation_keys, streams_metadata
+from .align import align_arrays, resample_tolerance
+from .profiling import phase
+from .planner import plan_query
 
-def describe_streams(streams):
+
+def _stream_extent(stream):
+    """
+    Helper function for describe_streams() returning the version, earliest and latest timestamps of a stream.
+    """
+    version = stream.version()
+    try:
+        earliest = stream.earliest(version=version)[0].time
+        latest = stream.latest(version=version)[0].time
+    except Exception:
+        # streams without any data point
+        earliest, latest = None, None
+    return version, earliest, latest
+
+
+def describe_streams(streams, cache=None, conn=None, extended=False, as_dataframe=False, max_workers=8):
     """
     This function prints streams info("Collection", "Name", "Units", "UUID") in tabular format.
     
     Parameters
     ----------
     streams : list of Stream objects or Streamset.
+    cache : library.metadata.MetadataCache, default=None
+        Cache of the stream tags.
+    conn : BTrDB connection object, default=None
+        If specified, the tags and annotations of all the streams are fetched with a single metadata query
+        instead of one tags() call per stream.
+    extended : bool, default=False
+        Also return the version, earliest and latest timestamps (in nanoseconds) of each stream.
+        They are fetched concurrently for all the streams.
+    as_dataframe : bool, default=False
+        Return a pandas.DataFrame instead of the tabulate string. 
+        When conn is specified, the dataframe also has one column per annotation.
+    max_workers : int, default=8
+        Maximum number of streams queried at the same time when extended is True.
     
     Examples
     ----------
     >>> streams = db.streams_in_collection('sunshine/PMU3')
     >>> print(describe_streams(streams))
+    >>> df = describe_streams(streams, conn=db, extended=True, as_dataframe=True)
     """   
-    table = [["Index", "Collection", "Name", "Units", "UUID"]]
-    for idx, stream in enumerate(streams):
-        tags = stream.tags()
-        table.append([idx, stream.collection, stream.name, tags["unit"], stream.uuid])
-    return tabulate(table, headers="firstrow")
+    streams = list(streams)
+    if conn is not None:
+        metadata = streams_metadata(conn, [stream.uuid for stream in streams], cache=cache)
+        units = [metadata[str(stream.uuid)]['unit'] for stream in streams]
+        annotations = [metadata[str(stream.uuid)].get('annotations') or {} for stream in streams]
+    else:
+        units = []
+        for stream in streams:
+            tags = stream.tags() if cache is None else cache.get(('tags', stream.uuid), stream.tags)
+            units.append(tags["unit"])
+        annotations = None
+    
+    headers = ["Index", "Collection", "Name", "Units", "UUID"]
+    table = [[idx, stream.collection, stream.name, unit, stream.uuid] 
+             for idx, (stream, unit) in enumerate(zip(streams, units))]
+    
+    if extended:
+        headers += ["Version", "Earliest", "Latest"]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for row, extent in zip(table, executor.map(_stream_extent, streams)):
+                row.extend(extent)
+    
+    if as_dataframe:
+        df = pd.DataFrame(table, columns=headers).set_index("Index")
+        if annotations is not None:
+            df = df.join(pd.DataFrame(annotations, index=df.index))
+        return df
+    return tabulate([headers] + table, headers="firstrow")
 
 
-def get_streamset(conn, collection_name, return_metadata=False, return_uuid=False, **kwargs):
+def get_streamset(conn, collection_name, return_metadata=False, return_uuid=False, cache=None, **kwargs):
     """
     This function creates dynamic sql queries depending on the input kwargs being passed in for tags and annotations.
     
@@ -40,6 +98,9 @@ def get_streamset(conn, collection_name, return_metadata=False, return_uuid=Fals
         Return the json metadata of each stream if set to True.
     return_uuid : bool, default=False 
         Return the uuid of each stream if set to True.
+    cache : library.metadata.MetadataCache, default=None
+        Cache of the annotation keys of each collection, of the query results and of the stream objects.
+        Repeated calls with the same arguments do not query the database while the entries are valid.
     kwargs : List of column names in PostgreSQL database that are used to identify the streams. 
                      For non-annotations keys besides collection, the format is key='str' or key=[str1, str2]
                      For annotations keys, the format is annotations={'key':str1} or annotations={'key':[str1,str2]}
@@ -107,11 +168,11 @@ def get_streamset(conn, collection_name, return_metadata=False, return_uuid=Fals
         ########## Check to see if user-passed-in-annotations are actually in annotations ##########
         not_found_annotations= {}
         
-        # go through each collection to make sure the annotations keys being passed in actually exist in metadata
-        not_found_in_collections=[]
+        # make sure the annotations keys being passed in actually exist in metadata, for all collections in one query
+        collections_annotations = collection_annotation_keys(conn, collection_name, cache=cache)
         for collection in collection_name:
             
-            collection_annotations = set(conn.collection_metadata(collection)[1].keys())
+            collection_annotations = collections_annotations[collection]
             check_annotations = set(annotations.keys()).difference(collection_annotations)
                         
             if len(check_annotations) > 0: 
@@ -147,7 +208,10 @@ def get_streamset(conn, collection_name, return_metadata=False, return_uuid=Fals
     for sql_statement in sql_list:
         sql = sql + " and" + sql_statement
         
-    streams_metadata = conn.query(sql, query_params)
+    if cache is not None:
+        streams_metadata = cache.get(('query', sql, tuple(query_params)), lambda: conn.query(sql, query_params))
+    else:
+        streams_metadata = conn.query(sql, query_params)
     
     if return_metadata:
         return streams_metadata 
@@ -155,14 +219,230 @@ def get_streamset(conn, collection_name, return_metadata=False, return_uuid=Fals
     if return_uuid:
         streams_metadata = [s['uuid'] for s in streams_metadata]
         return streams_metadata
+    
+    uuids = [s['uuid'] for s in streams_metadata]
+    if cache is not None:
+        # only look up the streams that are not cached yet, all in one call
+        cached = {uuid: cache.lookup(('stream', str(uuid))) for uuid in uuids}
+        missing = [uuid for uuid, (found, _) in cached.items() if not found]
+        if len(missing) > 0:
+            for stream in conn.streams(*missing):
+                cache.set(('stream', str(stream.uuid)), stream)
+        return btrdb.stream.StreamSet([cache.get(('stream', str(uuid)), lambda: conn.stream_from_uuid(uuid)) 
+                                       for uuid in uuids])
         
-    streams_metadata = conn.streams(*[s['uuid'] for s in streams_metadata])
+    streams_metadata = conn.streams(*uuids)
     
     return streams_metadata
 
 
+def _query_stream(stream, start, end, pw=None, width=None, depth=None):
+    """
+    Helper function for streams_to_df() that runs the aligned_windows(), windows() or values() query of a single stream.
+    """
+    if pw is not None:
+        return stream.aligned_windows(start, end, pw)
+    elif width is not None:
+        return stream.windows(start, end, width, depth=depth)
+    else:
+        return stream.values(start, end)
+
+
+def points_to_columns(data, agg):
+    """
+    Converts the result of values(), aligned_windows() or windows() into NumPy columns without building intermediate Python tuples.
+    
+    Parameters
+    ----------
+    data : list of (RawPoint, int) or (StatPoint, int)
+        Points and versions as returned by a btrdb query.
+    agg : [str]
+        Attributes of the points to extract, e.g. ['value', 'time'] or ['min', 'mean', 'max', 'time'].
+        
+    Returns
+    ----------
+    times : numpy.array of int64
+        Timestamps of the points in nanoseconds.
+    values : numpy.array of float64
+        2-D array with one column per attribute in agg (excluding 'time'), in the same order as agg.
+    """
+    value_agg = [a for a in agg if a != 'time']
+    dtype = [('time', np.int64)] + [(a, np.float64) for a in value_agg]
+    with phase('convert'):
+        # attrgetter and fromiter walk the points in C and fill a preallocated record array
+        getter = attrgetter('time', *value_agg)
+        records = np.fromiter(map(getter, map(itemgetter(0), data)), dtype=dtype, count=len(data))
+        
+        values = np.empty((len(records), len(value_agg)), dtype=np.float64)
+        for i, a in enumerate(value_agg):
+            values[:, i] = records[a]
+        return records['time'].copy(), values
+
+
+def align_columns(times_list, values_list, mode='exact', **kwargs):
+    """
+    Aligns per-stream NumPy columns on a shared time vector.
+    
+    Parameters
+    ----------
+    times_list : list of numpy.array of int64
+        Sorted timestamps of each stream in nanoseconds.
+    values_list : list of numpy.array of float64
+        2-D values of each stream with one column per aggregate.
+    mode : str, default='exact'
+        'exact' (union of the timestamps), 'nearest' or 'resample', see library.align.align_arrays().
+    kwargs :
+        tolerance, rate, method, start, end, origin and how, see library.align.align_arrays().
+        
+    Returns
+    ----------
+    index : numpy.array of int64
+        Shared timestamps in nanoseconds.
+    matrix : numpy.array of float64
+        2-D array with the columns of all streams side by side, with NaN where a stream has no point.
+    """
+    if len(times_list) == 0:
+        return np.array([], dtype=np.int64), np.empty((0, 0), dtype=np.float64)
+    with phase('align'):
+        return align_arrays(times_list, values_list, mode=mode, **kwargs)
+
+
+def columns_to_df(times_list, values_list, columns, mode='exact', **kwargs):
+    """
+    Builds the multi-index dataframe of streams_to_df() in a single allocation from per-stream NumPy columns.
+    
+    Parameters
+    ----------
+    times_list : list of numpy.array of int64
+        Sorted timestamps of each stream in nanoseconds.
+    values_list : list of numpy.array of float64
+        2-D values of each stream with one column per aggregate.
+    columns : list of tuple
+        Column labels ('collection', 'unit', 'name', 'agg') for every column of every stream, in order.
+    mode : str, default='exact'
+        Alignment mode, see align_columns().
+    kwargs :
+        Parameters of the alignment mode, see align_columns().
+        
+    Returns
+    ----------
+    df : pandas.DataFrame
+        Dataframe indexed by the shared timestamps, with NaN where a stream has no point.
+    """
+    column_index = pd.MultiIndex.from_tuples(columns, names=['collection', 'unit', 'name', 'agg'])
+    if len(times_list) == 0:
+        return pd.DataFrame(columns=column_index, index=pd.Index([], dtype=np.int64, name='time'))
+    
+    index, matrix = align_columns(times_list, values_list, mode=mode, **kwargs)
+    with phase('dataframe'):
+        return pd.DataFrame(matrix, index=pd.Index(index, name='time'), columns=column_index, copy=False)
+
+
+def _get_agg(pw=None, width=None, agg=None):
+    """
+    Helper function that returns the point attributes to extract for a values(), aligned_windows() or windows() query.
+    """
+    if pw is not None or width is not None:
+        if agg is not None: 
+            agg = list(set(agg))
+        else :
+            agg = ['min','mean','max', 'count', 'stddev']
+    else : 
+        agg = ['value']
+        
+    if 'time' not in agg : 
+        agg.append('time')
+    return agg
+
+
+def _raw_as_stats(values_list, columns, agg):
+    """
+    Helper function that converts raw value columns into the columns of the given stat point aggregates,
+    each raw point being a window of one point: min, mean and max are its value, count is 1 and stddev is 0.
+    """
+    value_agg = [a for a in agg if a != 'time']
+    constants = {'count': 1.0, 'stddev': 0.0}
+    values_list = [np.column_stack([np.full(len(values), constants[a]) if a in constants else values[:, 0]
+                                    for a in value_agg]) for values in values_list]
+    columns = [column[:3] + (a,) for column in columns for a in value_agg]
+    return values_list, columns
+
+
+def _align_kwargs(align, tolerance, rate, method, start, end, origin):
+    """
+    Helper function that returns the parameters of align_columns() for the alignment mode of streams_to_df().
+    """
+    if align == 'resample':
+        return dict(tolerance=tolerance, rate=rate, method=method, start=start, end=end, origin=origin)
+    if align == 'nearest':
+        return dict(tolerance=tolerance)
+    return {}
+
+
+def _align_margin(align, tolerance, rate, method, n_streams):
+    """
+    Helper function that returns how far beyond a chunk the data must be fetched so that the rows of the chunk
+    are aligned exactly as they are when the whole time range is aligned at once.
+    """
+    if align == 'resample' and rate is not None:
+        # samples up to the tolerance away from the grid points of the chunk are used
+        return tolerance if tolerance is not None else resample_tolerance(rate, method)
+    if align == 'nearest' and tolerance is not None:
+        # a row holds at most one point per stream, each within the tolerance of the next one
+        return tolerance * max(n_streams, 1)
+    return 0
+
+
+def _fetch_columns(streams, start, end, agg, query_kwargs, max_workers=None, prog_bar=None, cache=None):
+    """
+    Helper function that queries every stream, optionally on a thread pool or through a QueryCache, 
+    and converts the results into NumPy columns.
+    """
+    value_agg = [a for a in agg if a != 'time']
+    
+    def query(stream):
+        if cache is not None:
+            cached = cache.fetch(stream, start, end, **query_kwargs)
+            if len(cached['time']) == 0:
+                return None
+            return np.array(cached['time']), np.column_stack([cached[a] for a in value_agg])
+        data = _query_stream(stream, start, end, **query_kwargs)
+        if len(data) == 0:
+            return None
+        # converting right away releases the point objects of each stream as soon as possible
+        return points_to_columns(data, agg)
+    
+    results = [None] * len(streams)
+    if max_workers is None or max_workers == 1:
+        for ith_stream, stream in enumerate(streams):
+            results[ith_stream] = query(stream)
+            if prog_bar is not None:
+                prog_bar.update(1)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(query, stream): ith_stream for ith_stream, stream in enumerate(streams)}
+            # update the progress bar as soon as any stream is done, but keep results in stream order
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                if prog_bar is not None:
+                    prog_bar.update(1)
+    
+    columns = []
+    times_list = []
+    values_list = []
+    for stream, result in zip(streams, results):
+        if result is None:
+            continue
+        times, values = result
+        times_list.append(times)
+        values_list.append(values)
+        columns.extend((stream.collection, stream.unit, stream.name, a) for a in value_agg)
+    return times_list, values_list, columns
+
+
 def streams_to_df(streams, start, end, pw=None, width=None, depth=None, agg=None, 
-                  to_datetime=False, disable_progress_bar=False):  
+                  to_datetime=False, disable_progress_bar=False, max_workers=None, cache=None,
+                  align='exact', tolerance=None, rate=None, method='nearest', max_points=None, max_bytes=None):  
     """
     This function query the data of the input streams and return their values in panda dataframe format.
     
@@ -189,6 +469,27 @@ def streams_to_df(streams, start, end, pw=None, width=None, depth=None, agg=None
         Return the timestamps as datetime instead of nanoseconds.
    disable_progress_bar : bool, default=False
         Disable progress bar when querying data when set True.
+   max_workers : int, default=None
+        Maximum number of streams queried at the same time using a thread pool.
+        If None or 1, the streams are queried one after another.
+   cache : library.cache.QueryCache, default=None
+        Local query cache to read the data from. Queries that are not cached yet are stored in it.
+   align : str, default='exact'
+        How the streams are aligned: 'exact' on the union of their timestamps, 'nearest' on timestamps 
+        within tolerance of each other, or 'resample' on a fixed rate grid. See library.align.align_arrays().
+   tolerance : int, default=None
+        Tolerance in nanoseconds of the 'nearest' and 'resample' alignments.
+   rate : int or float, default=None
+        Rate of the grid in hertz of the 'resample' alignment.
+   method : str, default='nearest'
+        'nearest', 'previous' or 'linear' sampling of the 'resample' alignment.
+   max_points : int, default=None
+        If pw and width are not specified, query at the finest resolution returning at most this many points 
+        per stream (e.g. the width of a plot in pixels), raw values included. See library.planner.plan_query().
+        The columns are those of agg at every resolution: raw values are returned as windows of one point,
+        with min, mean and max equal to the value, a count of 1 and a stddev of 0.
+   max_bytes : int, default=None
+        If pw and width are not specified, query at the finest resolution whose result fits in this many bytes.
     
     Returns 
     ----------
@@ -199,55 +500,213 @@ def streams_to_df(streams, start, end, pw=None, width=None, depth=None, agg=None
     Examples
     ----------
     >>> data = streams_to_df(streamset, start_time, end_time, pw=26, agg=['mean'], to_datetime=True)
+    # query up to 8 streams at the same time
+    >>> data = streams_to_df(streamset, start_time, end_time, pw=26, agg=['mean'], max_workers=8)
+    # PMUs with jittery timestamps on a shared 30 Hz grid
+    >>> data = streams_to_df(streamset, start_time, end_time, align='resample', rate=30)
+    # at most 1500 points per stream, whatever the zoom level
+    >>> data = streams_to_df(streamset, start_time, end_time, agg=['min', 'mean', 'max'], max_points=1500)
     """     
     if depth is not None and width is None:
         raise ValueError('width must be specified with depth when using windows().')
     
-    if pw is not None or width is not None:
-        if agg is not None: 
-            agg = list(set(agg))
-        else :
-            agg = ['min','mean','max', 'count', 'stddev']
-    else : 
-        agg = ['value']
-        
-    if 'time' not in agg : 
-        agg.append('time')
+    if max_workers is not None and max_workers < 1:
+        raise ValueError('max_workers must be a positive integer.')
     
     # if only one stream being passed in, put it in a list
     if isinstance(streams, btrdb.stream.Stream):
         streams = [streams]
     
-    df_dict = {}
-    prog_bar = tqdm(enumerate(streams), total=len(streams), disable=disable_progress_bar,
+    planned = pw is None and width is None and (max_points is not None or max_bytes is not None)
+    if planned:
+        plan = plan_query(streams, start, end, max_points=max_points, max_bytes=max_bytes, agg=agg)
+        pw, width, depth = plan['pw'], plan['width'], plan['depth']
+    # a planned query keeps the stat point columns when it falls back to raw values
+    raw_as_stats = planned and pw is None and width is None
+    stat_agg = _get_agg(0, None, agg) if raw_as_stats else None
+    agg = _get_agg(pw, width, agg)
+    
+    prog_bar = tqdm(total=len(streams), disable=disable_progress_bar,
                     desc='Getting streams', dynamic_ncols=True)
-    for ith_stream, stream in prog_bar:        
-        if pw is not None:
-            data = stream.aligned_windows(start, end, pw)
-        elif width is not None:
-            data = stream.windows(start, end, width, depth=depth)
-        else:
-            data = stream.values(start, end)
-
-        if len(data) > 0:
-            points, _ = zip(*data)
-        else:
-            continue
-
-        data = [tuple(getattr(point,a) for a in agg) for point in points]
-        streams_df = pd.DataFrame(data, columns = agg)
-        streams_df = streams_df.set_index('time', drop=True)
-        df_dict[(stream.collection, stream.unit, stream.name)] = streams_df
+    times_list, values_list, columns = _fetch_columns(streams, start, end, agg, 
+                                                      dict(pw=pw, width=width, depth=depth), 
+                                                      max_workers=max_workers, prog_bar=prog_bar, cache=cache)
+    prog_bar.close()
+    if raw_as_stats:
+        values_list, columns = _raw_as_stats(values_list, columns, stat_agg)
 
-    df = pd.concat(df_dict, axis=1)
-    df.columns.names =  ['collection', 'unit', 'name', 'agg']
+    df = columns_to_df(times_list, values_list, columns, mode=align, 
+                       **_align_kwargs(align, tolerance, rate, method, start, end, start))
     
     if to_datetime:
-        df.index = pd.to_datetime(df.index)
+        with phase('to_datetime'):
+            df.index = pd.to_datetime(df.index)
         
     return df
 
 
+def iter_streams_chunks(streams, start, end, pw=None, width=None, depth=None, agg=None, 
+                        chunk_ns=None, chunk_points=None, sample_rate=None, as_array=False,
+                        to_datetime=False, disable_progress_bar=False, max_workers=None, prefetch=True,
+                        cache=None, align='exact', tolerance=None, rate=None, method='nearest'):
+    """
+    Generator version of streams_to_df() that yields the queried data in aligned chunks of bounded size, 
+    so that arbitrarily long time ranges can be processed in constant memory.
+    
+    Parameters
+    ----------
+    streams : btrdb.Stream, [btrdb.Stream], or btrdb.Stream.Streamset
+        Desired streams to query the data for.
+    start : int or float
+        Start time to query data in nanoseconds.
+    end : int or float
+        End time to query data in nanoseconds.  
+    pw : int, default=None
+        Pointwidth used to query data using aligned_windows().
+    width : int, default=None
+        Width used to query data using windows().
+    depth : int, default=None
+        Depth used to query data using windows(). 
+    agg : [str] default=None
+        Aggregates to use when using aligned_windows() or windows(). See streams_to_df().
+    chunk_ns : int, default=None
+        Duration of each chunk in nanoseconds. 
+        Rounded up to a multiple of the window size when using aligned_windows() or windows().
+    chunk_points : int, default=None
+        Number of points per stream in each chunk. Used instead of chunk_ns.
+        Requires pw, width or sample_rate to be specified.
+    sample_rate : int or float, default=None
+        Sample rate of the streams in hertz, used to convert chunk_points to a duration for raw values.
+    as_array : bool, default=False
+        Yield (times, values, columns) NumPy arrays instead of a dataframe.
+    to_datetime : bool, default=False
+        Return the timestamps as datetime instead of nanoseconds. Ignored if as_array is True.
+    disable_progress_bar : bool, default=False
+        Disable progress bar when querying data when set True.
+    max_workers : int, default=None
+        Maximum number of streams queried at the same time within a chunk. See streams_to_df().
+    prefetch : bool, default=True
+        Query the next chunk in the background while the current chunk is being processed.
+        At most two chunks are held in memory at any time.
+    cache : library.cache.QueryCache, default=None
+        Local query cache to read the chunks from. See streams_to_df().
+    align, tolerance, rate, method :
+        Alignment of the streams, see streams_to_df(). With 'nearest' and 'resample', each chunk is fetched 
+        with an overlap of the tolerance on both sides and trimmed to its range, so that the chunks hold 
+        the same rows as a single streams_to_df() call.
+    
+    Yields 
+    ----------
+    df : pandas.DataFrame
+        Chunk of the dataframe returned by streams_to_df() for the same arguments.
+    or (times, values, columns) : (numpy.array, numpy.array, list of tuple)
+        If as_array is True, the int64 timestamps, the 2-D float64 values and the column labels of the chunk.
+        
+    Examples
+    ----------
+    >>> for chunk in iter_streams_chunks(streamset, start_time, end_time, chunk_ns=ns_delta(hours=1)):
+    ...     process(chunk)
+    >>> for times, values, columns in iter_streams_chunks(streamset, start_time, end_time, pw=20, 
+    ...                                                   chunk_points=100000, as_array=True):
+    ...     process(values)
+    """
+    if depth is not None and width is None:
+        raise ValueError('width must be specified with depth when using windows().')
+    
+    if max_workers is not None and max_workers < 1:
+        raise ValueError('max_workers must be a positive integer.')
+    
+    if (chunk_ns is None) == (chunk_points is None):
+        raise ValueError('exactly one of chunk_ns or chunk_points must be specified.')
+    
+    # duration covered by a single point, so chunk boundaries never split a window
+    if pw is not None:
+        step = 2 ** int(pw)
+    elif width is not None:
+        step = int(width)
+    elif sample_rate is not None:
+        step = int(1e9 / sample_rate)
+    elif chunk_points is not None:
+        raise ValueError('sample_rate must be specified with chunk_points when querying raw values.')
+    else:
+        step = 1
+    
+    if chunk_points is not None:
+        chunk_ns = int(chunk_points) * step
+    chunk_ns = int(np.ceil(chunk_ns / step)) * step
+    if chunk_ns <= 0:
+        raise ValueError('chunk size must be positive.')
+    
+    agg = _get_agg(pw, width, agg)
+    query_kwargs = dict(pw=pw, width=width, depth=depth)
+    
+    # if only one stream being passed in, put it in a list
+    if isinstance(streams, btrdb.stream.Stream):
+        streams = [streams]
+    
+    start, end = int(start), int(end)
+    # the 'resample' grid starts at the requested start, as in streams_to_df()
+    origin = start
+    # aligned_windows() snaps its range to the pointwidth, so the chunks must start on a window boundary too
+    if pw is not None:
+        start = start - start % step
+    boundaries = list(range(start, end, chunk_ns)) + [end]
+    # chunks are fetched with an overlap so that the rows near their boundaries align as in a single query,
+    # then trimmed to their own range, in whole windows for stat points
+    margin = _align_margin(align, tolerance, rate, method, len(streams))
+    margin = int(np.ceil(margin / step)) * step
+    
+    def fetch(ith_chunk):
+        return _fetch_columns(streams, max(boundaries[ith_chunk] - margin, start), 
+                              min(boundaries[ith_chunk + 1] + margin, end), agg, query_kwargs, 
+                              max_workers=max_workers, cache=cache)
+    
+    prog_bar = tqdm(total=len(boundaries) - 1, disable=disable_progress_bar,
+                    desc='Getting chunks', dynamic_ncols=True)
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        pending = None
+        for ith_chunk in range(len(boundaries) - 1):
+            if pending is not None:
+                times_list, values_list, columns = pending.result()
+            else:
+                times_list, values_list, columns = fetch(ith_chunk)
+            
+            pending = None
+            if executor is not None and ith_chunk + 2 < len(boundaries):
+                pending = executor.submit(fetch, ith_chunk + 1)
+            prog_bar.update(1)
+            
+            if len(times_list) == 0:
+                continue
+            
+            align_kwargs = _align_kwargs(align, tolerance, rate, method, max(boundaries[ith_chunk], origin),
+                                         boundaries[ith_chunk + 1], origin)
+            if as_array:
+                times, values = align_columns(times_list, values_list, mode=align, **align_kwargs)
+                if margin > 0:
+                    first, last = np.searchsorted(times, boundaries[ith_chunk:ith_chunk + 2])
+                    times, values = times[first:last], values[first:last]
+                    if len(times) == 0:
+                        continue
+                yield times, values, columns
+            else:
+                df = columns_to_df(times_list, values_list, columns, mode=align, **align_kwargs)
+                if margin > 0:
+                    first, last = df.index.searchsorted(boundaries[ith_chunk:ith_chunk + 2])
+                    df = df.iloc[first:last]
+                    if len(df) == 0:
+                        continue
+                if to_datetime:
+                    with phase('to_datetime'):
+                        df.index = pd.to_datetime(df.index)
+                yield df
+    finally:
+        prog_bar.close()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
 def to_nearest_pointwidth(days=0, hours=0, minutes=0, seconds=0, milliseconds=0, 
                           microseconds=0, nanoseconds=0, hertz=0):
     """
@@ -321,9 +780,10 @@ def seconds2pointwidth(seconds):
     return np.log(1e9*seconds) / np.log(2) 
 
 
-def get_global_mean_value(stream, pw=55, version=0):
+def get_global_mean_value(stream, pw=55, version=0, cache=None):
     """
     Returns the global mean value of a stream. Useful for programmatically estimating the nominal value.
+    See library.aggregate.aggregate_streams() to compute it for many streams at once, over any time range.
     
     Parameters
     ----------
@@ -333,6 +793,8 @@ def get_global_mean_value(stream, pw=55, version=0):
         Pointwidth.
     version : int, default=0
         Stream version.
+    cache : library.cache.QueryCache, default=None
+        Local query cache to read the stat points from.
         
     Returns
     ----------
@@ -341,21 +803,26 @@ def get_global_mean_value(stream, pw=55, version=0):
     """  
     earliest_time = stream.earliest()[0][0]
     latest_time = stream.latest()[0][0]
+    if cache is not None:
+        columns = cache.fetch(stream, earliest_time, latest_time, pw=pw, version=version)
+        return np.average(columns['mean'], weights=columns['count'])
+    
     # Get all of the stat points at the highest level of the tree as possible
     statpoints, _ = zip(*stream.aligned_windows(
         start=earliest_time, end=latest_time, pointwidth=pw, version=version
     ))
 
     # Unless you have decades of data, this will likely only be one stat point
-    # use np.mean() to ensure only 1 overall mean of all statspoints being returned
-    sps_mean = np.mean([sp.mean for sp in statpoints])
+    # weight each stat point by its count to ensure only 1 overall mean of all statspoints being returned
+    sps_mean = np.average([sp.mean for sp in statpoints], weights=[sp.count for sp in statpoints])
     return sps_mean
 
 
 def get_event_data(stream, event_time, window_in_sec_left = 0.5, window_in_sec_right=0.5, version=0,
-                  return_timestamp=False):
+                  return_timestamp=False, cache=None):
     """
     Returns the raw values of a stream around a specified event time. The duration of the data returned is adjustable, defaulting to one second centering the event time.
+    See library.events.get_events_data() to extract many windows at once.
     
     Parameters
     ----------
@@ -371,6 +838,8 @@ def get_event_data(stream, event_time, window_in_sec_left = 0.5, window_in_sec_r
         Stream version.
     return_timestamp : bool, default=False
         Whether to return the timestamps or only the stream values.
+    cache : library.cache.QueryCache, default=None
+        Local query cache to read the raw values from.
         
     Returns
     ----------
@@ -382,6 +851,14 @@ def get_event_data(stream, event_time, window_in_sec_left = 0.5, window_in_sec_r
     window_in_nanosec_left = 1e9 * window_in_sec_left 
     window_in_nanosec_right = 1e9 * window_in_sec_right 
     
+    if cache is not None:
+        columns = cache.fetch(stream, event_time-window_in_nanosec_left, 
+                              event_time+window_in_nanosec_right, version=version)
+        if return_timestamp:
+            return tuple(columns['time'].tolist()), np.array(columns['value'])
+        else:
+            return np.array(columns['value'])
+    
     raw_points, _ = zip(*stream.values(event_time-window_in_nanosec_left, 
                                        event_time+window_in_nanosec_right, 
                                        version)) 
@@ -402,23 +879,206 @@ def freq_vs_size(size_min, size_max):
 def integral(x):
     return -x-np.log(1-x)
 
+def _sliding_sum(x, k):
+    """
+    Helper function returning the sums of every window of k consecutive rows of a 2-D array in O(n).
+    """
+    c = np.zeros((x.shape[0] + 1, x.shape[1]))
+    np.cumsum(x, axis=0, out=c[1:])
+    return c[k:] - c[:-k]
+
+
+def _sliding_extreme(x, k, func):
+    """
+    Helper function returning the minimum or maximum (func=np.minimum or np.maximum) of every window 
+    of k consecutive rows of a 2-D array in O(n), using the van Herk/Gil-Werman block algorithm.
+    """
+    n, ncols = x.shape
+    nblocks = -(-n // k)
+    fill = np.inf if func is np.minimum else -np.inf
+    padded = np.full((nblocks * k, ncols), fill)
+    padded[:n] = x
+    blocks = padded.reshape(nblocks, k, ncols)
+    # running extreme from the start of each block and from the end of each block
+    prefix = func.accumulate(blocks, axis=1).reshape(-1, ncols)
+    suffix = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, ncols)
+    return func(suffix[:n - k + 1], prefix[k - 1:n])
+
+
+def rolling_stats(data, window, stats=('mean', 'std', 'min', 'max'), ddof=0, shift=None):
+    """
+    Computes rolling statistics over every window of `window` consecutive samples in O(n), 
+    for all the columns of a 2-D array or dataframe at once.
+    
+    Parameters
+    ----------
+    data : numpy.array, pandas.Series or pandas.DataFrame
+        1-D or 2-D data with samples along the first axis.
+    window : int
+        Number of samples in each window.
+    stats : tuple of str, default=('mean', 'std', 'min', 'max')
+        Statistics to compute. The statistics that can be used are : ['mean', 'std', 'var', 'min', 'max'].
+    ddof : int, default=0
+        Delta degrees of freedom of the variance and standard deviation, as in np.std().
+    shift : numpy.array, default=None
+        Value subtracted from each column before accumulating the sums, to keep the variance numerically stable.
+        Defaults to the first row of data.
+    
+    Returns
+    ----------
+    results : dict
+        Maps each statistic to its rolling values, one row per complete window (len(data) - window + 1 rows).
+        Row i summarizes the samples i to i + window - 1. Pandas inputs return pandas objects indexed by the 
+        index of the last sample of each window.
+        
+    Examples
+    ----------
+    >>> rolling = rolling_stats(df, window=3600, stats=('mean', 'std'))
+    >>> rolling['mean'].plot()
+    """
+    unknown = set(stats).difference(['mean', 'std', 'var', 'min', 'max'])
+    if len(unknown) > 0:
+        raise ValueError(f'{unknown} are not valid rolling statistics.')
+    window = int(window)
+    if window < 1:
+        raise ValueError('window must be a positive integer.')
+    
+    values = np.asarray(data, dtype=np.float64)
+    is_1d = values.ndim == 1
+    x = values.reshape(len(values), -1)
+    n = len(x)
+    
+    results = {}
+    if n < window:
+        results = {stat: np.empty((0, x.shape[1])) for stat in stats}
+    else:
+        if 'mean' in stats or 'std' in stats or 'var' in stats:
+            shift = x[0] if shift is None else np.asarray(shift, dtype=np.float64)
+            centered = x - shift
+            sums = _sliding_sum(centered, window)
+            mean = sums / window
+            if 'mean' in stats:
+                results['mean'] = mean + shift
+            if 'std' in stats or 'var' in stats:
+                squares = _sliding_sum(centered * centered, window)
+                var = np.maximum(squares - sums * mean, 0) / max(window - ddof, 1)
+                if 'var' in stats:
+                    results['var'] = var
+                if 'std' in stats:
+                    results['std'] = np.sqrt(var)
+        if 'min' in stats:
+            results['min'] = _sliding_extreme(x, window, np.minimum)
+        if 'max' in stats:
+            results['max'] = _sliding_extreme(x, window, np.maximum)
+    
+    for stat in stats:
+        result = results[stat][:, 0] if is_1d else results[stat]
+        if isinstance(data, pd.DataFrame):
+            result = pd.DataFrame(result, index=data.index[window - 1:], columns=data.columns)
+        elif isinstance(data, pd.Series):
+            result = pd.Series(result, index=data.index[window - 1:], name=data.name)
+        results[stat] = result
+    return {stat: results[stat] for stat in stats}
+
+
+class RollingStats(object):
+    """
+    Rolling statistics over successive chunks of data. The last window - 1 samples of each chunk are kept,
+    so the windows spanning two chunks are computed exactly as if the data had been passed in at once.
+    
+    Parameters
+    ----------
+    window : int
+        Number of samples in each window.
+    stats : tuple of str, default=('mean', 'std', 'min', 'max')
+        Statistics to compute, see rolling_stats().
+    ddof : int, default=0
+        Delta degrees of freedom of the variance and standard deviation.
+        
+    Examples
+    ----------
+    >>> rolling = RollingStats(window=3600, stats=('mean', 'std'))
+    >>> for chunk in iter_streams_chunks(streams, start, end, chunk_ns=ns_delta(days=1)):
+    ...     results = rolling.update(chunk)
+    """
+    def __init__(self, window, stats=('mean', 'std', 'min', 'max'), ddof=0):
+        self.window = int(window)
+        self.stats = stats
+        self.ddof = ddof
+        self._tail = None
+        self._shift = None
+
+    def update(self, chunk):
+        """
+        Adds the next chunk of samples and returns the statistics of every window ending in it, see rolling_stats().
+        """
+        if self._tail is not None and len(self._tail) > 0:
+            if isinstance(chunk, (pd.DataFrame, pd.Series)):
+                data = pd.concat([self._tail, chunk])
+            else:
+                data = np.concatenate([self._tail, np.asarray(chunk, dtype=np.float64)])
+        else:
+            data = chunk
+        if self._shift is None and len(data) > 0:
+            # keep the same shift for every chunk so the sums stay consistent
+            self._shift = np.asarray(data, dtype=np.float64).reshape(len(data), -1)[0]
+        
+        keep = max(len(data) - self.window + 1, 0)
+        self._tail = data.iloc[keep:] if isinstance(data, (pd.DataFrame, pd.Series)) else np.asarray(data)[keep:]
+        return rolling_stats(data, self.window, stats=self.stats, ddof=self.ddof, shift=self._shift)
+
+
 def window_avg(timeseries, sampling_period, num_seconds=60):
-    print(sampling_period)
+    """
+    Moving average of a timeseries over windows of num_seconds, computed in O(n).
+    
+    Parameters
+    ----------
+    timeseries : numpy.array
+        Values of the timeseries.
+    sampling_period : int or float
+        Time between two samples in seconds.
+    num_seconds : int or float, default=60
+        Duration of the averaging window in seconds.
+        
+    Returns
+    ----------
+    avg_timeseries : numpy.array
+        Average of the num_avg samples starting at each of the first len(timeseries) - num_avg samples.
+    num_avg : int
+        Number of samples in each window.
+    """
     num_avg = int(num_seconds/sampling_period)
-    print(num_avg)
     num_points = len(timeseries)
-    avg_timeseries = np.zeros(num_points-num_avg)
-    
-    for i in range(num_points-num_avg):
-        avg_timeseries[i] = np.mean(timeseries[i:i+num_avg])
-    return avg_timeseries, num_avg
-  
+    if num_points <= num_avg:
+        return np.zeros(0), num_avg
+    avg_timeseries = rolling_stats(np.asarray(timeseries), num_avg, stats=('mean',))['mean']
+    return avg_timeseries[:num_points-num_avg], num_avg
+
+
 def window_std(timeseries, sampling_period, num_seconds=60):
-    print(sampling_period)
+    """
+    Moving standard deviation of a timeseries over windows of num_seconds, computed in O(n).
+    
+    Parameters
+    ----------
+    timeseries : numpy.array
+        Values of the timeseries.
+    sampling_period : int or float
+        Time between two samples in seconds.
+    num_seconds : int or float, default=60
+        Duration of the window in seconds.
+        
+    Returns
+    ----------
+    std_timeseries : numpy.array
+        Standard deviation of the num_avg samples starting at each of the first len(timeseries) - num_avg samples.
+    num_avg : int
+        Number of samples in each window.
+    """
     num_avg = int(num_seconds/sampling_period)
-    print(num_avg)
     num_points = len(timeseries)
-    std_timeseries = np.zeros(num_points-num_avg)
-    for i in range(num_points-num_avg):
-        std_timeseries[i] = np.std(timeseries[i:i+num_avg])
-    return std_timeseries, num_avg
\ No newline at end of file
+    if num_points <= num_avg:
+        return np.zeros(0), num_avg
+    std_timeseries = rolling_stats(np.asarray(timeseries), num_avg, stats=('std',))['std']
+    return std_timeseries[:num_points-num_avg], num_avg
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the library is imported as a package from the analytics directory, as in the notebooks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from library.fake import FakeBTrDB
+
+
+START = 1_600_000_000 * 10**9
+
+
+@pytest.fixture
+def db():
+    return FakeBTrDB(latency=0, seed=0)
+
+
+@pytest.fixture
+def start():
+    return START
@@ -0,0 +1,17 @@
+import numpy as np
+
+from library.aggregate import aggregate_streams
+
+
+def test_aggregate_streams_empty_stream(db, start):
+    times = start + np.arange(0, 10 * 10**9, 10**9 // 30)
+    values = np.sin(np.arange(len(times)))
+    stream = db.add_stream('test', 'value', 'volts', times, values)
+    empty = db.add_stream('test', 'empty', 'volts', np.array([], dtype=np.int64), np.array([]))
+
+    stats = aggregate_streams([stream, empty])
+    assert stats.loc[str(stream.uuid), 'count'] == len(values)
+    assert np.isclose(stats.loc[str(stream.uuid), 'mean'], values.mean())
+    assert np.isclose(stats.loc[str(stream.uuid), 'stddev'], values.std())
+    assert stats.loc[str(empty.uuid), 'count'] == 0
+    assert np.isnan(stats.loc[str(empty.uuid), 'mean'])
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+
+from library.bench import _load_point_on_wave_utils
+
+
+@pytest.fixture(scope='module')
+def pow_utils():
+    return _load_point_on_wave_utils()
+
+
+def test_get_points_from_collection_raw_ignores_agg(pow_utils, db, start):
+    streams = db.add_point_on_wave('POW/signatures/event1', start, 10**8, rate=20000)
+
+    df = pow_utils.get_points_from_collection(db, 'POW/signatures/event1', agg=['min', 'max'])
+    assert list(df.columns) == [s.collection + '/' + s.name for s in streams]
+    assert len(df) > 0 and df.notna().all().all()
+
+    stats = pow_utils.get_points_from_collection(db, 'POW/signatures/event1', resolution=20, agg=['min', 'max'])
+    assert stats.shape[1] == 2 * len(streams)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from library.search import find_extremes
+
+
+def test_find_extremes_windows_stay_in_range(db, start):
+    times = start + np.arange(0, 60 * 10**9, 10**9 // 30)
+    values = np.zeros(len(times))
+    # on a window boundary, so that no window straddles the end of the range
+    end = start + 50 * 10**9
+    end -= end % 2**26
+    # the global extremes are just after the end of the range
+    values[(times >= end) & (times < end + 10 * 10**9)] = 100.0
+    values[600] = 10.0
+    stream = db.add_stream('test', 'value', 'volts', times, values)
+
+    extremes = find_extremes(stream, k=5, start=start, end=end, pw=40, window_pw=26)
+    assert len(extremes) == 5
+    for _, time, _ in extremes:
+        assert time < end and time + 2**26 > start
+    assert extremes[0][2] == 10.0
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from library.utils import streams_to_df, iter_streams_chunks
+
+
+def test_streams_to_df_planned_raw_keeps_agg(db, start):
+    streams = db.add_pmu('test/PMU1', start, 600 * 10**9, rate=30, currents=False)[:2]
+    for stream in streams:
+        stream.update(annotations={'sample_rate': '30'})
+
+    zoomed_out = streams_to_df(streams, start, start + 600 * 10**9, agg=['mean', 'count'], max_points=1000,
+                               disable_progress_bar=True)
+    zoomed_in = streams_to_df(streams, start, start + 20 * 10**9, agg=['mean', 'count'], max_points=1000,
+                              disable_progress_bar=True)
+    assert len(zoomed_in) == 600
+    assert sorted(zoomed_in.columns) == sorted(zoomed_out.columns)
+    raw = streams_to_df(streams, start, start + 20 * 10**9, disable_progress_bar=True)
+    assert np.array_equal(zoomed_in.xs('mean', axis=1, level='agg').values, raw.values)
+    assert (zoomed_in.xs('count', axis=1, level='agg') == 1).all().all()
+
+
+@pytest.mark.parametrize('kwargs', [dict(align='exact'), dict(align='nearest', tolerance=8 * 10**6),
+                                    dict(align='resample', rate=30, method='nearest'),
+                                    dict(align='resample', rate=30, method='previous'),
+                                    dict(align='resample', rate=30, method='linear'),
+                                    dict(pw=30, align='nearest', tolerance=10),
+                                    dict(pw=30, align='resample', rate=1)])
+def test_iter_streams_chunks_equals_streams_to_df(db, start, kwargs):
+    streams = [s for i in range(3)
+               for s in db.add_pmu(f'test/PMU{i}', start, 120 * 10**9, rate=30, jitter=3 * 10**6)[:2]]
+    # neither the start nor the chunk size are aligned on the pointwidth
+    query_start, end = start + 123456789, start + 120 * 10**9
+
+    df = streams_to_df(streams, query_start, end, disable_progress_bar=True, **kwargs)
+    chunks = list(iter_streams_chunks(streams, query_start, end, chunk_ns=7_300_000_000,
+                                      disable_progress_bar=True, **kwargs))
+    assert pd.concat(chunks).equals(df)
@@ -5,16 +5,105 @@ import btrdb
 from btrdb.utils.timez import *
 
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from operator import attrgetter, itemgetter
 from matplotlib import pyplot as plt
 
 def seconds2pointwidth(seconds):
     return np.log(1e9*seconds) / np.log(2) 
 
-def write_to_stream(stream, times, values):
+def times_to_ns(times):
+    # converts nanosecond ints, datetimes, numpy datetime64 or ISO 8601 strings to an int64 nanosecond array at once
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.integer):
+        return times.astype(np.int64, copy=False)
+    if np.issubdtype(times.dtype, np.floating):
+        return times.astype(np.int64)
+    times = pd.DatetimeIndex(pd.to_datetime(times, utc=True)).tz_localize(None)
+    return times.values.astype('datetime64[ns]').view(np.int64)
+
+
+def _insert_batch(stream, times, values, merge='replace', retries=3, retry_delay=1):
+    # merge='replace' makes inserting the same batch twice harmless, so failed batches can simply be retried
+    points = list(zip(times.tolist(), values.tolist()))
+    for attempt in range(retries + 1):
+        try:
+            return stream.insert(points, merge=merge)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(retry_delay * 2**attempt)
+
+
+def write_to_stream(stream, times, values, batch_size=None, merge='replace'):
     if hasattr(times, '__len__'):
-        stream.insert(list(zip(times, values)), merge='replace')
+        times = times_to_ns(times)
+        values = np.asarray(values, dtype=np.float64)
+        batch_size = len(times) if batch_size is None else batch_size
+        for i in range(0, len(times), max(batch_size, 1)):
+            _insert_batch(stream, times[i:i+batch_size], values[i:i+batch_size], merge=merge)
     else:
-        stream.insert([(times, values),], merge='replace')
+        stream.insert([(times, values),], merge=merge)
+
+
+def bulk_insert(data, batch_size=50000, max_workers=4, max_pending=None, 
+                merge='replace', retries=3, retry_delay=1, verbose=False):
+    """
+    Inserts data into many streams in size-bounded batches on a bounded thread pool.
+    
+    data : dict mapping each btrdb.Stream to a pandas.Series (indexed by time) or a (times, values) tuple. 
+           Times can be nanosecond ints, datetimes, numpy datetime64 or ISO 8601 strings.
+    batch_size : maximum number of points per insert.
+    max_workers : maximum number of inserts running at the same time.
+    max_pending : maximum number of batches prepared but not inserted yet (defaults to 2 * max_workers). 
+                  Batches are only built when there is room, which bounds memory use.
+    merge : merge policy of stream.insert. The default 'replace' makes retries idempotent.
+    retries, retry_delay : number of retries of a failed batch, and initial delay in seconds (doubled at each retry).
+    verbose : print the number of points inserted and the throughput when done.
+    
+    Returns a dict with the number of points and batches inserted, the elapsed seconds and the points per second.
+    
+    >>> stats = bulk_insert({stream: df[name] for stream, name in zip(streams, df.columns)})
+    >>> stats = bulk_insert(dict(zip(stream_objects, [(timestamps, d['values']) for d in stream_data])))
+    """
+    max_pending = 2 * max_workers if max_pending is None else max_pending
+    
+    def batches():
+        for stream, series in data.items():
+            if isinstance(series, pd.Series):
+                times, values = series.index, series.to_numpy(dtype=np.float64)
+            else:
+                times, values = series
+            times = times_to_ns(times)
+            values = np.asarray(values, dtype=np.float64)
+            for i in range(0, len(times), batch_size):
+                yield stream, times[i:i+batch_size], values[i:i+batch_size]
+    
+    go = time.time()
+    n_points = 0
+    n_batches = 0
+    pending = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for stream, times, values in batches():
+            # backpressure: wait for a batch to complete before preparing more than max_pending
+            while len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(_insert_batch, stream, times, values, 
+                                        merge=merge, retries=retries, retry_delay=retry_delay))
+            n_points += len(times)
+            n_batches += 1
+        for future in pending:
+            future.result()
+    
+    elapsed = time.time() - go
+    stats = {'points': n_points, 'batches': n_batches, 'seconds': elapsed, 
+             'points_per_sec': n_points / elapsed if elapsed > 0 else np.nan}
+    if verbose:
+        print(f"Inserted {n_points} points in {n_batches} batches, {stats['points_per_sec']:.0f} points/sec")
+    return stats
 
 
 def get_stream_duration(stream, unit='hours'):
@@ -38,9 +127,14 @@ def print_stream_summary(stream):
         Size: {np.round(stream.count()/1e6, 2)} million points
         """)
     
-def print_metadata_summary(db, collection):
-    streams = db.streams_in_collection(collection)
-    metadata, _ = streams[0].annotations()
+def print_metadata_summary(db, collection, cache=None):
+    # cache is an optional analytics/library MetadataCache shared with get_streamset and describe_streams
+    def load():
+        streams = db.streams_in_collection(collection)
+        metadata, _ = streams[0].annotations()
+        return metadata
+    
+    metadata = load() if cache is None else cache.get(('collection_annotations', collection), load)
     
     print('\n', collection)
     for key in metadata.keys():
@@ -48,28 +142,57 @@ def print_metadata_summary(db, collection):
         
 
 def convert_timestamp(time, t0=None, tf=None, convert_to=None):
+    # accepts a single nanosecond timestamp or any array of them (list, numpy array, pandas Series),
+    # arrays are converted at once as int64 nanoseconds
+    if convert_to is None:
+        return time
+    
+    if isinstance(time, (int, np.integer)):
+        if convert_to == 'datetime':
+            return ns_to_datetime(int(time))
+        elif convert_to == 'relative':
+            return (time - t0)/1e9
+        elif convert_to == 'normalized':
+            return (time - t0) / (tf - t0)
+        raise ValueError(f'unknown time conversion {convert_to}')
+    
+    index = time.index if isinstance(time, pd.Series) else None
+    ns = np.asarray(time, dtype=np.int64)
+    
     if convert_to == 'datetime':
-        if type(time) == int:
-            return ns_to_datetime(time)
-        else:
-            return [ns_to_datetime(t) for t in time]
-
+        converted = pd.to_datetime(ns, unit='ns', utc=True)
+        if index is None:
+            return converted
+        return pd.Series(converted, index=index, name=time.name)
+    
     elif convert_to == 'relative':
-        if type(time) == int:
-            return (time - t0)/1e9
-        
-        elif hasattr(time, '__len__'):
-            return (time - min(time))/1e9
+        t0 = ns.min() if t0 is None else t0
+        converted = (ns - t0) / 1e9
         
-    elif 'normalized':
-        if type(time) == int:
-            return (time - t0) / (tf - t0)
+    elif convert_to == 'normalized':
+        t0 = ns.min() if t0 is None else t0
+        tf = ns.max() if tf is None else tf
+        converted = (ns - t0) / (tf - t0)
         
-        elif hasattr(time, '__len__'):
-            return [(t - t0) / (tf - t0) for t in time]
+    else:
+        raise ValueError(f'unknown time conversion {convert_to}')
+    
+    if index is None:
+        return converted
+    return pd.Series(converted, index=index, name=time.name)
 
-    elif time_conversion == None:
-        return time
+
+def points_to_arrays(points, attributes):
+    # extracts attributes of (point, version) tuples into a numpy record array in a single pass,
+    # without building a python object per row
+    dtype = [(a, np.int64 if a in ('time', 'count') else np.float64) for a in attributes]
+    points = map(itemgetter(0), points)
+    if len(attributes) == 1:
+        values = np.fromiter(map(attrgetter(attributes[0]), points), dtype=dtype[0][1])
+        records = np.empty(len(values), dtype=dtype)
+        records[attributes[0]] = values
+        return records
+    return np.fromiter(map(attrgetter(*attributes), points), dtype=dtype)
 
     
 def points_to_dataframe(points, 
@@ -87,20 +210,15 @@ def points_to_dataframe(points,
 
     if resolution == 'full':
         # create dataframe from raw point values
-        df = pd.DataFrame(columns=['time','value'], index=range(len(points)))
-        
-        for i, (point, _) in enumerate(points):
-            time = convert_timestamp(point.time, **time_kwargs)
-            df.loc[i] = [time, point.value]
-        
+        columns = ['time','value']
     else:
         # create dataframe from statpoint attributes
-        df = pd.DataFrame(columns=aggregates, index=range(len(points)))
-        for i, (point, _) in enumerate(points):
-            df.loc[i] = [getattr(point, attr) for att in aggregates]
-            
-            if convert_time_to != None:
-                df['time'].loc[i] = convert_timestamp(point.time, **time_kwargs)
+        columns = list(aggregates)
+    
+    records = points_to_arrays(points, columns)
+    df = pd.DataFrame({c: records[c] for c in columns}, columns=columns)
+    if 'time' in columns:
+        df['time'] = convert_timestamp(records['time'], **time_kwargs)
                                 
     if use_time_as_index:                
         # resets index to use time instead of range
@@ -109,34 +227,95 @@ def points_to_dataframe(points,
     return df
 
 
+def _stream_columns(stream, start, end, resolution, aggregates):
+    # raw values or stat points of a stream as int64 times and one float64 array per aggregate
+    if resolution == 'full':
+        records = points_to_arrays(stream.values(start, end), ['time', 'value'])
+        return records['time'], [records['value']]
+    records = points_to_arrays(stream.aligned_windows(start, end, resolution), ['time'] + list(aggregates))
+    return records['time'], [records[a].astype(np.float64) for a in aggregates]
+
+
+def _collection_frame(db, collection, resolution='full', filter_kwargs={}, rename_cols=False,
+                      convert_time_to=None, agg='mean'):
+    # aligned dataframe of every stream of a collection, indexed by time,
+    # with one column per stream named collection/name (or name), or (stream, aggregate) columns if agg is a list
+    if resolution != 'full' and not isinstance(resolution, (int, np.integer)):
+        raise ValueError(f"resolution must be 'full' or an integer pointwidth, not {resolution}")
+    streams = db.streams_in_collection(collection, **filter_kwargs)
+    if len(streams) == 0:
+        return pd.DataFrame(index=pd.Index([], dtype=np.int64, name='time'))
+    
+    start, _ = streams[0].earliest()
+    end, _ = streams[0].latest()
+    # agg only applies to stat points, raw values have a single column per stream
+    aggregates = ['value'] if resolution == 'full' else [agg] if isinstance(agg, str) else list(agg)
+    
+    columns = [_stream_columns(s, start.time, end.time, resolution, aggregates) for s in streams]
+    index = np.unique(np.concatenate([times for times, _ in columns]))
+    data = np.full((len(index), len(streams) * len(aggregates)), np.nan)
+    for i, (times, values) in enumerate(columns):
+        rows = np.searchsorted(index, times)
+        for j, v in enumerate(values):
+            data[rows, i * len(aggregates) + j] = v
+    
+    names = [s.name if rename_cols else s.collection + '/' + s.name for s in streams]
+    if resolution == 'full' or isinstance(agg, str):
+        labels = pd.Index(names)
+    else:
+        labels = pd.MultiIndex.from_product([names, aggregates])
+    
+    if convert_time_to is not None:
+        index = convert_timestamp(index, t0=index.min(), tf=index.max(), convert_to=convert_time_to)
+    return pd.DataFrame(data, index=pd.Index(index, name='time'), columns=labels)
+
+
 def get_points_from_collection(db, collection,
-                               resolution='full',
+                               resolution='full', # accepts: 'full' or integer pointwidth
                                filter_kwargs={}, 
                                rename_cols=False,
-                               convert_time_to=None,
+                               convert_time_to=None, # accepts: None, datetime, relative, normalized
+                               agg='mean', # statpoint aggregate(s) used with a pointwidth resolution
                                ):
+    # dataframe of the streams of an event collection, from raw values or from stat points of an integer pointwidth.
+    # The index is the time, and there is one column per stream named collection/name (or name if rename_cols), 
+    # or one (stream, aggregate) column per aggregate if agg is a list, e.g. ['min', 'mean', 'max'].
+    return _collection_frame(db, collection, resolution=resolution, filter_kwargs=filter_kwargs, 
+                             rename_cols=rename_cols, convert_time_to=convert_time_to, agg=agg)
+
+
+def iter_points_from_collections(db, collections, max_workers=8, max_pending=None, **kwargs):
+    """
+    Loads many event collections concurrently on a bounded thread pool and yields them as they complete.
     
-    streams = db.streams_in_collection(collection, **filter_kwargs)
-    streamset = btrdb.stream.StreamSet(streams)
-    
-    start, _ = streams[0].earliest()
-    end, _ = streams[0].latest()
+    collections : collection names, e.g. db.list_collections('POW/signatures').
+    max_workers : maximum number of collections loaded at the same time.
+    max_pending : maximum number of collections loaded but not yielded yet (defaults to 2 * max_workers). 
+                  Collections are only submitted when there is room, which bounds memory use.
+    kwargs : resolution, filter_kwargs, rename_cols, convert_time_to and agg, see get_points_from_collection.
     
-    if resolution == 'full':
-        df = streamset.filter(start.time, end.time).to_dataframe()
-        
-    elif type(resolution) == int:
-        # to do
-        pass
-    
-    if convert_time_to != None:
-        df['time'] = convert_timestamp(df['time'], 
-                                       t0=df['time'].min(), tf=df['time'].max(), 
-                                       convert_to=convert_time_to)
-        
-    if rename_cols == True:
-        df = df.rename(columns=dict(zip(df.keys().tolist(), [s.name for s in streams])))
-        
-    return df
+    Yields (collection, df) in completion order, df being the dataframe of get_points_from_collection.
     
-        
+    >>> for collection, df in iter_points_from_collections(db, collections, resolution=20):
+    ...     plots.plot_event_timeseries(df, db.streams_in_collection(collection))
+    """
+    max_pending = 2 * max_workers if max_pending is None else max_pending
+    collections = iter(collections)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                # backpressure: only submit collections while there is room for their results
+                while len(pending) < max_pending:
+                    collection = next(collections, None)
+                    if collection is None:
+                        break
+                    pending[executor.submit(_collection_frame, db, collection, **kwargs)] = collection
+                if len(pending) == 0:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+        finally:
+            for future in pending:
+                future.cancel()